@@ -5,28 +5,146 @@
 
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, Gdk, GLib, Gio
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import Gtk, Gdk, GLib, Gio, GObject, GdkPixbuf
 import os
-import json
-import requests
+import time
+import hashlib
 import threading
-import subprocess
-import shutil
-from urllib.parse import quote
-from pathlib import Path
-
-# --- Константы ---
-CONFIG_DIR = os.path.expanduser("~/.config/appimages")
-CONFIG_FILE = os.path.join(CONFIG_DIR, "settings.json")
-APP_DIR = "/usr/local/bin/appimages"
-ICON_BASE_DIR = os.path.expanduser("~/.local/share/icons/hicolor/128x128/apps")
-DEFAULT_APPIMAGE_DIR = os.path.expanduser("~/AppImages")
-
-def ensure_dir(path):
-    try:
-        Path(path).mkdir(parents=True, exist_ok=True)
-        return True
-    except Exception:
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+
+from appimages_core import (
+    HTTP_TIMEOUT, ICON_BASE_DIR, ICON_CACHE_DIR, ICON_DISK_CACHE_MAX_BYTES, ICON_MAX_BYTES,
+    ICON_MEMORY_CACHE_SIZE, ICON_SIZE, ICON_WORKERS, SEARCH_DEBOUNCE_MS, SEARCH_MIN_CHARS,
+    TRACE_FILE, DownloadCancelled, DownloadJob, DownloadQueue, ProgressPublisher, SearchSession,
+    apply_delta_update, blend_results, check_updates, ensure_dir, evict_lru_files, format_eta,
+    format_size, get_cache_refresher, get_catalog, get_http_cache, get_http_session, get_inventory,
+    get_launch_cache, get_rate_limiter, get_tracer, install_item, is_installed, load_settings,
+    match_score, plan_install, save_settings, search_all_sources, set_launch_mode, update_item)
+
+# Период проверки отзывчивости главного цикла и обновления окна отладки
+MAINLOOP_PROBE_MS = 100
+DEBUG_REFRESH_MS = 1000
+
+# --- Главный цикл ---
+def idle_add(callback, *args):
+    # GLib.idle_add с учётом очереди: сколько вызовов ждёт главного цикла и сколько они ждали
+    tracer = get_tracer()
+    queued_at = time.perf_counter()
+    tracer.gauge_add('idle_backlog', 1)
+
+    def run():
+        tracer.gauge_add('idle_backlog', -1)
+        tracer.observe('idle_delay_ms', (time.perf_counter() - queued_at) * 1000)
+        callback(*args)
+        return False
+
+    GLib.idle_add(run)
+
+# --- Результаты поиска и иконки в интерфейсе ---
+class SearchResult(GObject.Object):
+    # Элемент Gio.ListStore для списка результатов
+    __gtype_name__ = 'AppImageSearchResult'
+
+    def __init__(self, item):
+        super().__init__()
+        self.item = item
+
+    @staticmethod
+    def compare(a, b, *user_data):
+        key_a = (-a.item.get('score', 0), a.item['name'].lower())
+        key_b = (-b.item.get('score', 0), b.item['name'].lower())
+        return (key_a > key_b) - (key_a < key_b)
+
+class IconLoader:
+    # Иконки результатов: скачиваются и декодируются в пуле потоков, готовые
+    # уменьшенные pixbuf'ы лежат в LRU в памяти, исходные файлы — в дисковом кэше.
+    # callback(pixbuf) всегда вызывается в главном цикле GTK.
+    def __init__(self, size=ICON_SIZE, capacity=ICON_MEMORY_CACHE_SIZE, cache_dir=ICON_CACHE_DIR):
+        self.size = size
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self._pixbufs = OrderedDict()
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=ICON_WORKERS)
+
+    def request(self, url, callback):
+        with self._lock:
+            pixbuf = self._pixbufs.get(url)
+            if pixbuf is not None:
+                self._pixbufs.move_to_end(url)
+            elif url in self._waiting:
+                self._waiting[url].append(callback)
+                return
+            else:
+                self._waiting[url] = [callback]
+                self._pool.submit(self._load, url)
+                return
+        callback(pixbuf)
+
+    def _fetch(self, url):
+        path = os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest())
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            pass
+        # Размер ограничен ICON_MAX_BYTES, как и у иконок установленных приложений:
+        # по Content-Length сразу, иначе — по мере чтения
+        with get_http_session().get(url, stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit() and int(length) > ICON_MAX_BYTES:
+                raise ValueError(f"иконка больше {format_size(ICON_MAX_BYTES)}")
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > ICON_MAX_BYTES:
+                    raise ValueError(f"иконка больше {format_size(ICON_MAX_BYTES)}")
+        data = bytes(data)
+        ensure_dir(self.cache_dir)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        evict_lru_files(self.cache_dir, ICON_DISK_CACHE_MAX_BYTES)
+        return data
+
+    def _decode(self, data):
+        loader = GdkPixbuf.PixbufLoader()
+        loader.write(data)
+        loader.close()
+        pixbuf = loader.get_pixbuf()
+        width, height = pixbuf.get_width(), pixbuf.get_height()
+        scale = self.size / max(width, height, 1)
+        if scale < 1:
+            pixbuf = pixbuf.scale_simple(max(1, int(width * scale)), max(1, int(height * scale)),
+                                         GdkPixbuf.InterpType.BILINEAR)
+        return pixbuf
+
+    def _load(self, url):
+        try:
+            pixbuf = self._decode(self._fetch(url))
+        except Exception as e:
+            get_tracer().error('icon.load', e)
+            pixbuf = None
+        with self._lock:
+            callbacks = self._waiting.pop(url, [])
+            if pixbuf is not None:
+                self._pixbufs[url] = pixbuf
+                while len(self._pixbufs) > self.capacity:
+                    self._pixbufs.popitem(last=False)
+        if pixbuf is not None:
+            idle_add(self._deliver, callbacks, pixbuf)
+
+    @staticmethod
+    def _deliver(callbacks, pixbuf):
+        for callback in callbacks:
+            callback(pixbuf)
         return False
 
 class AppImageManager(Gtk.Window):
@@ -37,23 +155,37 @@ class AppImageManager(Gtk.Window):
         self.set_border_width(10)
         self.set_position(Gtk.WindowPosition.CENTER)
 
-        defaults = {
-            'appimage_dir': DEFAULT_APPIMAGE_DIR,
-            'opacity': 0.95
-        }
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                self.settings = json.load(f)
-            self.settings = {**defaults, **self.settings}
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.settings = defaults
-
+        self.settings = load_settings()
         self.apply_transparency()
         self.initialize_app_directory()
-        self.download_active = False
-        self.current_download_path = None
+        self.selected_items = {}
+        self.select_buttons = {}
+        self.job_rows = {}
+        # Текущий поиск (SearchSession), его модель результатов и индекс по имени для слияния дублей
+        self.search_session = None
+        self.search_timer = None
+        self.results_store = None
+        self.results_by_name = {}
+        self.icon_loader = IconLoader()
+        self.installed_keys = (set(), set(), set())
+        self.download_queue = DownloadQueue(
+            self.run_download_job,
+            max_parallel=self.settings['max_parallel_downloads'],
+            bandwidth_limit=self.settings['bandwidth_limit_kib'] * 1024,
+            on_change=lambda job: idle_add(self.update_job_row, job))
+        # Прогресс всех загрузок уходит в UI одним вызовом, не чаще PROGRESS_UPDATES_PER_SEC раз в секунду
+        self.progress_publisher = ProgressPublisher(
+            self.publish_job_progress,
+            lambda delay, fn: GLib.timeout_add(int(delay * 1000), fn))
         self.setup_ui()
         self.connect("destroy", Gtk.main_quit)
+        # Запаздывание этого таймера — задержка, которую видит пользователь при вводе и перерисовке
+        self.probe_expected = time.perf_counter() + MAINLOOP_PROBE_MS / 1000
+        GLib.timeout_add(MAINLOOP_PROBE_MS, self.probe_main_loop)
+
+        if not self.settings['offline_mode'] and get_catalog().is_stale():
+            self.start_catalog_sync()
+        self.start_inventory_rescan()
 
     def setup_ui(self):
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
@@ -76,6 +208,21 @@ class AppImageManager(Gtk.Window):
         settings_item = Gtk.MenuItem(label="Настройки")
         settings_item.connect("activate", self.open_settings)
         tools_menu.append(settings_item)
+        sync_item = Gtk.MenuItem(label="Обновить каталог")
+        sync_item.connect("activate", lambda w: self.start_catalog_sync())
+        tools_menu.append(sync_item)
+        update_item = Gtk.MenuItem(label="Обновить AppImage...")
+        update_item.connect("activate", self.on_update_appimage)
+        tools_menu.append(update_item)
+        installed_item = Gtk.MenuItem(label="Установленные приложения")
+        installed_item.connect("activate", self.show_installed)
+        tools_menu.append(installed_item)
+        check_updates_item = Gtk.MenuItem(label="Проверить обновления")
+        check_updates_item.connect("activate", self.on_check_updates)
+        tools_menu.append(check_updates_item)
+        debug_item = Gtk.MenuItem(label="Отладка")
+        debug_item.connect("activate", self.show_debug)
+        tools_menu.append(debug_item)
         menubar.append(tools_item)
 
         info_menu = Gtk.Menu()
@@ -91,6 +238,8 @@ class AppImageManager(Gtk.Window):
         self.entry_search.set_placeholder_text("Введите название приложения...")
         self.button_search = Gtk.Button(label="Поиск")
         self.button_search.connect("clicked", self.on_search_clicked)
+        self.entry_search.connect("activate", self.on_search_clicked)
+        self.entry_search.connect("changed", self.on_search_changed)
         hbox_search.pack_start(self.entry_search, True, True, 0)
         hbox_search.pack_start(self.button_search, False, False, 0)
         vbox.pack_start(hbox_search, False, False, 0)
@@ -106,224 +255,527 @@ class AppImageManager(Gtk.Window):
         self.statusbar.set_halign(Gtk.Align.START)
         vbox.pack_start(self.statusbar, False, False, 5)
 
-        self.button_download = Gtk.Button(label="Скачать")
+        self.button_download = Gtk.Button(label="Скачать выбранные")
         self.button_download.set_sensitive(False)
         self.button_download.connect("clicked", self.on_download_clicked)
         vbox.pack_start(self.button_download, False, False, 0)
 
-        self.progress_bar = Gtk.ProgressBar()
-        self.progress_bar.set_fraction(0.0)
-        self.progress_bar.set_text("0%")
-        self.progress_bar.set_show_text(True)
-        vbox.pack_start(self.progress_bar, False, False, 0)
+        self.listbox_jobs = Gtk.ListBox()
+        self.listbox_jobs.set_selection_mode(Gtk.SelectionMode.NONE)
+        scrolled_jobs = Gtk.ScrolledWindow()
+        scrolled_jobs.add(self.listbox_jobs)
+        scrolled_jobs.set_size_request(-1, 120)
+        vbox.pack_start(scrolled_jobs, False, True, 0)
 
     def update_status(self, text):
-        GLib.idle_add(self.statusbar.set_text, text)
+        idle_add(self.statusbar.set_text, text)
+
+    def on_search_changed(self, entry):
+        # Поиск по мере ввода: запрос уходит после паузы в наборе, каждое нажатие откладывает его
+        if not self.settings['search_as_you_type']:
+            return
+        if self.search_timer:
+            GLib.source_remove(self.search_timer)
+            self.search_timer = None
+        if len(entry.get_text().strip()) >= SEARCH_MIN_CHARS:
+            self.search_timer = GLib.timeout_add(SEARCH_DEBOUNCE_MS, self.on_search_timer)
+
+    def on_search_timer(self):
+        self.search_timer = None
+        self.start_search(self.entry_search.get_text().strip())
+        return False
 
     def on_search_clicked(self, widget):
+        if self.search_timer:
+            GLib.source_remove(self.search_timer)
+            self.search_timer = None
         query = self.entry_search.get_text().strip()
         if not query:
             self.update_status("Введите запрос для поиска!")
             return
+        self.start_search(query)
 
-        self.update_status("Поиск... Пожалуйста, подождите.")
-        self.listbox_results.foreach(lambda child: self.listbox_results.remove(child))
+    def start_search(self, query):
+        # Предыдущий поиск отменяется вместе с его запросами; его поздние порции
+        # отбрасываются по номеру поколения в add_results и finish_search
+        if self.search_session:
+            self.search_session.cancel()
+        search = SearchSession(query)
+        self.search_session = search
+
+        self.selected_items.clear()
+        self.select_buttons = {}
         self.button_download.set_sensitive(False)
 
-        thread = threading.Thread(target=self.search_appimages, args=(query,))
+        store = Gio.ListStore(item_type=SearchResult)
+        self.results_store = store
+        self.results_by_name = {}
+        self.listbox_results.bind_model(store, self.create_result_row)
+
+        # Каталог отвечает сразу и без сети, живой поиск GitHub догоняет в фоне
+        local_results = get_catalog().search(query)
+        self.add_results(search, local_results)
+        if self.settings['offline_mode'] and local_results:
+            self.finish_search(search, [])
+            return
+        self.update_status("Поиск... Пожалуйста, подождите.")
+
+        thread = threading.Thread(target=self.search_appimages, args=(search,))
         thread.daemon = True
         thread.start()
 
-    def search_appimages(self, query):
-        results = []
+    def search_appimages(self, search):
+        # Каждая готовая порция сразу попадает в список, не дожидаясь остальных источников
+        _, errors = search_all_sources(
+            search.query, session=search, include_hub=not get_catalog().is_populated(),
+            on_results=lambda batch: idle_add(self.add_results, search, batch))
+        idle_add(self.finish_search, search, errors)
+
+    def is_current_search(self, search):
+        return self.search_session is not None and search.generation == self.search_session.generation
+
+    def add_results(self, search, batch):
+        if not self.is_current_search(search):
+            return False
+        store = self.results_store
+        for item in batch:
+            key = item['name'].lower()
+            existing = self.results_by_name.get(key)
+            if existing:
+                # Дубль: поля живого результата дополняют запись каталога
+                item = blend_results(search.query, [existing.item], [item])[0]
+                found, position = store.find(existing)
+                if found:
+                    store.remove(position)
+                if self.selected_items.pop(self.result_key(existing.item), None):
+                    self.selected_items[self.result_key(item)] = item
+            elif 'score' not in item:
+                item = {**item, 'score': match_score(search.query, item['name'], item.get('description', ''))}
+            entry = SearchResult(item)
+            self.results_by_name[key] = entry
+            store.insert_sorted(entry, SearchResult.compare)
+        if store.get_n_items():
+            self.update_status(f"Найдено {store.get_n_items()} результатов...")
+        return False
+
+    def finish_search(self, search, errors):
+        if not self.is_current_search(search) or search.is_cancelled():
+            return False
+        count = self.results_store.get_n_items()
+        if errors and not count:
+            self.update_status(f"Ошибка поиска: {'; '.join(errors)}")
+        elif not count:
+            self.update_status("Ничего не найдено.")
+        else:
+            self.update_status(f"Найдено {count} результатов.")
+        return False
+
+    def start_catalog_sync(self):
+        self.update_status("Обновление каталога AppImageHub...")
+        thread = threading.Thread(target=self.sync_catalog)
+        thread.daemon = True
+        thread.start()
+
+    def sync_catalog(self):
         try:
-            hub_url = f"https://appimage.github.io/api/applications/?search={quote(query)}"
-            response = requests.get(hub_url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                for item in data.get('results', []):
-                    name = item.get('name', 'Без названия')
-                    description = item.get('description', 'Нет описания')
-                    download_url = item.get('download_url', '')
-                    icon_url = item.get('icon_url', '')
-                    if download_url and download_url.endswith('.AppImage'):
-                        results.append({
-                            'name': name,
-                            'description': description,
-                            'url': download_url,
-                            'icon_url': icon_url,
-                            'source': 'AppImageHub'
-                        })
-
-            gh_url = f"https://api.github.com/search/repositories?q={quote(query)}+AppImage+in:name,description"
-            response = requests.get(gh_url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                for item in data.get('items', [])[:5]:
-                    name = item.get('name', 'Без названия')
-                    description = item.get('description', 'Нет описания') or 'Нет описания'
-                    repo_url = item.get('html_url', '')
-                    direct_url = self.get_github_appimage_link(repo_url)
-                    if direct_url:
-                        results.append({
-                            'name': name,
-                            'description': description,
-                            'url': direct_url,
-                            'icon_url': '',
-                            'source': 'GitHub'
-                        })
+            changed = get_catalog().sync()
+            self.update_status(f"Каталог обновлён (изменено записей: {changed}).")
         except Exception as e:
-            GLib.idle_add(self.update_status, f"Ошибка поиска: {e}")
-            return
+            self.update_status(f"Не удалось обновить каталог: {e}")
 
-        GLib.idle_add(self.display_results, results)
+    def start_inventory_rescan(self):
+        thread = threading.Thread(target=self.rescan_inventory)
+        thread.daemon = True
+        thread.start()
 
-    def get_github_appimage_link(self, repo_url):
-        try:
-            api_url = repo_url.replace('https://github.com', 'https://api.github.com/repos') + '/releases/latest'
-            response = requests.get(api_url, timeout=10)
-            if response.status_code == 200:
-                release = response.json()
-                assets = release.get('assets', [])
-                for asset in assets:
-                    download_url = asset.get('browser_download_url', '')
-                    if download_url.endswith('.AppImage'):
-                        return download_url
-        except:
-            pass
-        return None
+    def rescan_inventory(self):
+        inventory = get_inventory()
+        inventory.rescan(self.settings['appimage_dir'])
+        self.installed_keys = inventory.installed_keys()
 
-    def display_results(self, results):
-        if not results:
-            self.update_status("Ничего не найдено.")
-            return
+    def show_installed(self, widget):
+        dialog = Gtk.Dialog(title="Установленные приложения", transient_for=self, flags=0)
+        dialog.add_buttons("Закрыть", Gtk.ResponseType.CLOSE)
+        dialog.set_default_size(600, 400)
+        listbox = Gtk.ListBox()
+        listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(listbox)
+        dialog.get_content_area().pack_start(scrolled, True, True, 0)
 
-        for item in results:
+        entries = get_inventory().entries()
+        if not entries:
+            listbox.add(Gtk.Label(label="Нет установленных приложений."))
+        for entry in entries:
             row = Gtk.ListBoxRow()
             hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
-            icon = Gtk.Image.new_from_icon_name("application-x-executable", Gtk.IconSize.DIALOG)
-            hbox.pack_start(icon, False, False, 0)
             vbox_info = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
-            label_name = Gtk.Label(label=f"<b>{item['name']}</b> ({item['source']})", use_markup=True)
+            title = entry['name'] + (f" {entry['version']}" if entry['version'] else "")
+            if entry['missing']:
+                title += " (файл не найден)"
+            label_name = Gtk.Label(label=title)
             label_name.set_halign(Gtk.Align.START)
-            label_desc = Gtk.Label(label=item['description'][:100] + "..." if len(item['description']) > 100 else item['description'])
-            label_desc.set_halign(Gtk.Align.START)
-            label_desc.get_style_context().add_class("dim-label")
+            label_path = Gtk.Label(label=f"{entry['path']} · {format_size(entry['size'] or 0)}")
+            label_path.set_halign(Gtk.Align.START)
+            label_path.get_style_context().add_class("dim-label")
             vbox_info.pack_start(label_name, False, False, 0)
-            vbox_info.pack_start(label_desc, False, False, 0)
+            vbox_info.pack_start(label_path, False, False, 0)
             hbox.pack_start(vbox_info, True, True, 0)
-            button_select = Gtk.Button(label="Выбрать")
-            button_select.connect("clicked", self.on_select_result, item)
-            hbox.pack_start(button_select, False, False, 0)
+            button_remove = Gtk.Button(label="Удалить")
+            button_remove.connect("clicked", self.on_uninstall_clicked, entry['path'], listbox, row)
+            hbox.pack_start(button_remove, False, False, 0)
             row.add(hbox)
-            self.listbox_results.add(row)
+            listbox.add(row)
 
-        self.listbox_results.show_all()
-        self.update_status(f"Найдено {len(results)} результатов.")
+        dialog.show_all()
+        dialog.run()
+        dialog.destroy()
 
-    def on_select_result(self, button, item):
-        self.selected_item = item
-        self.button_download.set_sensitive(True)
-        self.update_status(f"Выбрано: {item['name']} — готово к скачиванию.")
+    def on_uninstall_clicked(self, button, path, listbox, row):
+        # Удаление с кэшем быстрого запуска обходит /proc и каталоги — не в потоке интерфейса
+        button.set_sensitive(False)
+        self.update_status(f"Удаление {os.path.basename(path)}...")
+        thread = threading.Thread(target=self.run_uninstall, args=(path, listbox, row))
+        thread.daemon = True
+        thread.start()
 
-    def on_download_clicked(self, widget):
-        if not hasattr(self, 'selected_item'):
-            self.update_status("Сначала выберите приложение для скачивания!")
-            return
+    def run_uninstall(self, path, listbox, row):
+        removed = get_inventory().uninstall(path)
+        self.installed_keys = get_inventory().installed_keys()
+        idle_add(self.finish_uninstall, path, removed, listbox, row)
+
+    def finish_uninstall(self, path, removed, listbox, row):
+        if row.get_parent() is listbox:
+            listbox.remove(row)
+        self.update_status(f"Удалено: {os.path.basename(path)} (файлов: {len(removed)})")
+        return False
+
+    def on_check_updates(self, widget):
+        self.update_status("Проверка обновлений установленных приложений...")
+        thread = threading.Thread(target=self.run_update_check)
+        thread.daemon = True
+        thread.start()
+
+    def run_update_check(self):
+        inventory = get_inventory()
+        inventory.rescan(self.settings['appimage_dir'])
+        entries = inventory.entries()
+        checked = []
+
+        def on_result(result):
+            checked.append(result)
+            self.update_status(f"Проверено {len(checked)} из {len(entries)}...")
+
+        results = check_updates(entries, on_result=on_result)
+        idle_add(self.show_update_results, results)
+
+    def show_update_results(self, results):
+        outdated = [r for r in results if r['status'] == 'outdated']
+        deferred = [r for r in results if r['status'] == 'deferred']
+        self.update_status(f"Обновлений: {len(outdated)}, отложено проверок: {len(deferred)}, "
+                           f"всего проверено: {len(results)}.")
+
+        dialog = Gtk.Dialog(title="Обновления", transient_for=self, flags=0)
+        dialog.add_buttons("Закрыть", Gtk.ResponseType.CLOSE)
+        dialog.set_default_size(600, 400)
+        listbox = Gtk.ListBox()
+        listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(listbox)
+        dialog.get_content_area().pack_start(scrolled, True, True, 0)
+
+        states = {'outdated': "есть обновление", 'deferred': "проверка отложена", 'error': "ошибка",
+                  'unknown': "источник обновлений неизвестен", 'current': "актуально"}
+        for result in results:
+            row = Gtk.ListBoxRow()
+            hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+            vbox_info = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+            title = result['name'] + (f" {result['version']}" if result['version'] else "")
+            label_name = Gtk.Label(label=f"{title} — {states[result['status']]}")
+            label_name.set_halign(Gtk.Align.START)
+            label_detail = Gtk.Label(label=result['detail'])
+            label_detail.set_halign(Gtk.Align.START)
+            label_detail.get_style_context().add_class("dim-label")
+            vbox_info.pack_start(label_name, False, False, 0)
+            vbox_info.pack_start(label_detail, False, False, 0)
+            hbox.pack_start(vbox_info, True, True, 0)
+            if result['status'] == 'outdated':
+                button_update = Gtk.Button(label="Обновить")
+                button_update.connect("clicked", self.on_apply_update_clicked, result)
+                hbox.pack_start(button_update, False, False, 0)
+            row.add(hbox)
+            listbox.add(row)
+
+        dialog.show_all()
+        dialog.run()
+        dialog.destroy()
+        return False
+
+    def on_apply_update_clicked(self, button, result):
+        button.set_sensitive(False)
+        if result['method'] == 'zsync':
+            self.start_delta_update(result['path'])
+        else:
+            self.download_queue.submit(update_item(result))
+            self.update_status(f"{result['name']}: обновление добавлено в очередь.")
 
-        item = self.selected_item
-        url = item['url']
-        if not url:
-            self.update_status("Нет ссылки для скачивания!")
+    def on_update_appimage(self, widget):
+        dialog = Gtk.FileChooserDialog(
+            title="Выберите AppImage для обновления",
+            parent=self,
+            action=Gtk.FileChooserAction.OPEN
+        )
+        dialog.add_buttons("Отмена", Gtk.ResponseType.CANCEL, "OK", Gtk.ResponseType.OK)
+        dialog.set_current_folder(self.settings['appimage_dir'])
+        file_filter = Gtk.FileFilter()
+        file_filter.set_name("AppImage")
+        file_filter.add_pattern("*.AppImage")
+        dialog.add_filter(file_filter)
+        response = dialog.run()
+        path = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not path:
             return
 
-        filename = url.split('/')[-1]
-        if not filename.endswith('.AppImage'):
-            filename = f"{item['name'].replace(' ', '_')}.AppImage"
+        self.update_status(f"Проверка обновлений для {os.path.basename(path)}...")
+        self.start_delta_update(path)
 
-        self.current_download_path = os.path.join(self.settings['appimage_dir'], filename)
+    def start_delta_update(self, path):
+        # Дельта-обновление идёт в фоне; окно с прогрессом и кнопкой отмены закрывается по окончании
+        cancel = threading.Event()
+        dialog = Gtk.Dialog(title="Дельта-обновление", transient_for=self, flags=0)
+        dialog.add_buttons("Отмена", Gtk.ResponseType.CANCEL)
+        label = Gtk.Label(label=f"Проверка обновлений для {os.path.basename(path)}...")
+        label.set_margin_top(10)
+        label.set_margin_bottom(10)
+        dialog.get_content_area().pack_start(label, True, True, 0)
 
-        self.download_active = True
-        self.button_download.set_sensitive(False)
-        self.progress_bar.set_fraction(0.0)
-        self.update_status("Начинаю загрузку...")
+        def on_response(dialog, response):
+            cancel.set()
+            dialog.set_response_sensitive(Gtk.ResponseType.CANCEL, False)
+            label.set_text("Отмена...")
 
-        thread = threading.Thread(target=self.download_appimage, args=(url, self.current_download_path))
+        dialog.connect("response", on_response)
+        dialog.show_all()
+        thread = threading.Thread(target=self.update_appimage_file, args=(path, cancel, dialog, label))
         thread.daemon = True
         thread.start()
 
-    def download_appimage(self, url, filepath):
-        try:
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
+    def update_appimage_file(self, path, cancel, dialog, label):
+        progress = {'finished': False}
+
+        def publish(keys):
+            if not progress['finished']:
+                text = f"Дельта-обновление: {format_size(progress['done'])} из {format_size(progress['total'])}"
+                self.statusbar.set_text(text)
+                label.set_text(text)
 
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-
-            ensure_dir(os.path.dirname(filepath))
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if not self.download_active:
-                        GLib.idle_add(self.update_status, "Загрузка отменена.")
-                        return
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            fraction = downloaded / total_size
-                            GLib.idle_add(self.progress_bar.set_fraction, fraction)
-                            GLib.idle_add(self.progress_bar.set_text, f"{int(fraction * 100)}%")
-
-            os.chmod(filepath, 0o755)
-            self.create_desktop_entry(filepath, self.selected_item['name'], self.selected_item.get('icon_url', ''))
-
-            GLib.idle_add(self.update_status, "Загрузка завершена! Приложение установлено.")
-            GLib.idle_add(self.progress_bar.set_fraction, 1.0)
-            GLib.idle_add(self.progress_bar.set_text, "100% — Готово!")
+        publisher = ProgressPublisher(publish, lambda delay, fn: GLib.timeout_add(int(delay * 1000), fn))
 
+        def on_progress(done, total):
+            progress.update(done=done, total=total)
+            publisher.touch('delta')
+
+        try:
+            new_path, updater = apply_delta_update(path, progress_callback=on_progress,
+                                                   throttle=self.download_queue.bandwidth.consume,
+                                                   is_cancelled=cancel.is_set)
+        except DownloadCancelled:
+            self.update_status(f"{os.path.basename(path)}: обновление отменено.")
+            return
         except Exception as e:
-            GLib.idle_add(self.update_status, f"Ошибка загрузки: {e}")
+            self.update_status(f"Ошибка обновления: {e}")
+            return
         finally:
-            self.download_active = False
-            GLib.idle_add(self.button_download.set_sensitive, True)
+            progress['finished'] = True
+            idle_add(dialog.destroy)
+        if new_path is None:
+            self.update_status(f"{os.path.basename(path)}: обновление не требуется или недоступно.")
+        elif updater.tool:
+            self.update_status(f"Обновлено через {updater.tool}: {os.path.basename(new_path)}.")
+        else:
+            self.update_status(f"Обновлено: {os.path.basename(new_path)} — скачано {format_size(updater.downloaded_bytes)}, "
+                               f"взято из старой версии {format_size(updater.reused_bytes)}.")
 
-    def create_desktop_entry(self, appimage_path, name, icon_url):
-        desktop_filename = f"{name.replace(' ', '_').lower()}.desktop"
-        desktop_path = os.path.expanduser(f"~/.local/share/applications/{desktop_filename}")
+    def create_result_row(self, entry):
+        # Строка строится только при вставке элемента в модель; иконка подгружается асинхронно
+        item = entry.item
+        row = Gtk.ListBoxRow()
+        hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        icon = Gtk.Image.new_from_icon_name("application-x-executable", Gtk.IconSize.DIALOG)
+        icon.set_size_request(ICON_SIZE, ICON_SIZE)
+        hbox.pack_start(icon, False, False, 0)
+        if item.get('icon_url'):
+            self.icon_loader.request(item['icon_url'], icon.set_from_pixbuf)
+        vbox_info = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
+        badge = " — <i>установлено</i>" if is_installed(item, self.installed_keys) else ""
+        label_name = Gtk.Label(label=f"<b>{GLib.markup_escape_text(item['name'])}</b> ({item['source']}){badge}",
+                               use_markup=True)
+        label_name.set_halign(Gtk.Align.START)
+        label_desc = Gtk.Label(label=item['description'][:100] + "..." if len(item['description']) > 100 else item['description'])
+        label_desc.set_halign(Gtk.Align.START)
+        label_desc.get_style_context().add_class("dim-label")
+        vbox_info.pack_start(label_name, False, False, 0)
+        vbox_info.pack_start(label_desc, False, False, 0)
+        hbox.pack_start(vbox_info, True, True, 0)
+        button_select = Gtk.CheckButton(label="Выбрать")
+        button_select.set_active(self.result_key(item) in self.selected_items)
+        button_select.connect("toggled", self.on_select_result, item)
+        self.select_buttons[self.result_key(item)] = button_select
+        hbox.pack_start(button_select, False, False, 0)
+        row.add(hbox)
+        row.show_all()
+        return row
 
-        icon_path = "application-x-executable"
-        if icon_url:
-            icon_filename = f"{name.replace(' ', '_').lower()}.png"
-            icon_path = os.path.join(ICON_BASE_DIR, icon_filename)
-            try:
-                response = requests.get(icon_url, timeout=10)
-                if response.status_code == 200:
-                    ensure_dir(ICON_BASE_DIR)
-                    with open(icon_path, 'wb') as f:
-                        f.write(response.content)
-                    subprocess.run(['gtk-update-icon-cache', '-f', os.path.expanduser('~/.local/share/icons/hicolor')], capture_output=True)
-                    icon_path = icon_filename
-            except Exception as e:
-                print(f"Ошибка загрузки иконки: {e}")
-                icon_path = "application-x-executable"
-
-        desktop_content = f"""[Desktop Entry]
-Name={name}
-Exec={appimages.py}
-Icon={icon_path}
-Type=Application
-Categories=Utility;
-Comment=Запустить {name} через AppImage
-Terminal=false
-"""
+    def result_key(self, item):
+        return (item['name'], item['source'])
 
-        try:
-            ensure_dir(os.path.dirname(desktop_path))
-            with open(desktop_path, 'w') as f:
-                f.write(desktop_content)
-            subprocess.run(['update-desktop-database', os.path.expanduser('~/.local/share/applications')], capture_output=True)
-        except Exception as e:
-            self.update_status(f"Не удалось создать .desktop файл: {e}")
+    def on_select_result(self, button, item):
+        if button.get_active():
+            self.selected_items[self.result_key(item)] = item
+        else:
+            self.selected_items.pop(self.result_key(item), None)
+        self.button_download.set_sensitive(bool(self.selected_items))
+        self.update_status(f"Выбрано приложений: {len(self.selected_items)}")
+
+    def on_download_clicked(self, widget):
+        if not self.selected_items:
+            self.update_status("Сначала выберите приложение для скачивания!")
+            return
+
+        added = skipped = 0
+        for item in self.selected_items.values():
+            if self.download_queue.find_active(item):
+                skipped += 1
+            else:
+                self.download_queue.submit(item)
+                added += 1
+        # Выбор сбрасывается, чтобы повторное нажатие не ставило то же самое ещё раз
+        for key in list(self.selected_items):
+            button = self.select_buttons.get(key)
+            if button:
+                button.set_active(False)
+        self.selected_items.clear()
+        self.button_download.set_sensitive(False)
+        status = f"Добавлено в очередь: {added}"
+        if skipped:
+            status += f", уже в очереди: {skipped}"
+        self.update_status(status)
+
+    def run_download_job(self, job):
+        # Выполняется в рабочем потоке очереди — только данные задачи, без общего состояния окна
+        item = job.item
+        filepath = plan_install(item, self.settings['appimage_dir'])
+        if not filepath:
+            raise IOError("В последнем релизе нет файла AppImage")
+        self.download_queue.claim_path(job, filepath)
+
+        def on_progress(downloaded, total_size):
+            job.stats.update(downloaded, total_size)
+            self.progress_publisher.touch(job.id)
+
+        install_item(item, job.filepath, progress_callback=on_progress,
+                     is_cancelled=job.should_stop, throttle=self.download_queue.bandwidth.consume)
+        self.installed_keys = get_inventory().installed_keys()
+
+    def update_job_row(self, job):
+        row = self.job_rows.get(job.id)
+        if row is None:
+            row = self.build_job_row(job)
+            self.job_rows[job.id] = row
+
+        if job.stats.total > 0:
+            fraction = job.stats.done / job.stats.total
+            row['progress'].set_fraction(fraction)
+            row['progress'].set_text(f"{int(fraction * 100)}%")
+
+        states = {
+            DownloadJob.QUEUED: "В очереди",
+            DownloadJob.RUNNING: "Загрузка",
+            DownloadJob.PAUSED: "Пауза",
+            DownloadJob.CANCELLED: "Отменено",
+            DownloadJob.DONE: "Установлено",
+            DownloadJob.FAILED: f"Ошибка: {job.error}",
+        }
+        state_text = states[job.state]
+        if job.state == DownloadJob.RUNNING and job.stats.smoothed > 0:
+            eta = job.stats.eta()
+            state_text += (f" · {format_size(job.stats.instant)}/с"
+                           f" (сред. {format_size(job.stats.smoothed)}/с)")
+            if eta is not None:
+                state_text += f" · осталось {format_eta(eta)}"
+        elif job.state != DownloadJob.RUNNING:
+            job.stats.reset_rate()
+        row['state'].set_text(state_text)
+        if job.state == DownloadJob.DONE:
+            row['progress'].set_fraction(1.0)
+            row['progress'].set_text("100% — Готово!")
+        row['pause'].set_label("Продолжить" if job.state in (DownloadJob.PAUSED, DownloadJob.FAILED) else "Пауза")
+        finished = job.state in (DownloadJob.DONE, DownloadJob.CANCELLED)
+        row['pause'].set_sensitive(not finished)
+        row['priority'].set_sensitive(job.state == DownloadJob.QUEUED)
+        row['cancel'].set_label("Убрать" if finished else "Отмена")
+
+        if job.state == DownloadJob.DONE:
+            self.update_status(f"{job.item['name']}: загрузка завершена! Приложение установлено.")
+        elif job.state == DownloadJob.FAILED:
+            self.update_status(f"Ошибка загрузки {job.item['name']}: {job.error}")
+
+    def publish_job_progress(self, job_ids):
+        for job_id in job_ids:
+            job = self.download_queue.jobs.get(job_id)
+            if job and job.state == DownloadJob.RUNNING:
+                job.stats.sample()
+                self.update_job_row(job)
+
+    def build_job_row(self, job):
+        row = Gtk.ListBoxRow()
+        hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        label_name = Gtk.Label(label=job.item['name'])
+        label_name.set_halign(Gtk.Align.START)
+        label_name.set_width_chars(20)
+        label_state = Gtk.Label()
+        label_state.get_style_context().add_class("dim-label")
+        progress = Gtk.ProgressBar()
+        progress.set_show_text(True)
+        progress.set_text("0%")
+        button_pause = Gtk.Button(label="Пауза")
+        button_pause.connect("clicked", self.on_job_pause_clicked, job.id)
+        button_priority = Gtk.Button(label="↑")
+        button_priority.set_tooltip_text("Поднять приоритет")
+        button_priority.connect("clicked", self.on_job_priority_clicked, job.id)
+        button_cancel = Gtk.Button(label="Отмена")
+        button_cancel.connect("clicked", self.on_job_cancel_clicked, job.id)
+        hbox.pack_start(label_name, False, False, 0)
+        hbox.pack_start(progress, True, True, 0)
+        hbox.pack_start(label_state, False, False, 0)
+        hbox.pack_start(button_pause, False, False, 0)
+        hbox.pack_start(button_priority, False, False, 0)
+        hbox.pack_start(button_cancel, False, False, 0)
+        row.add(hbox)
+        self.listbox_jobs.add(row)
+        row.show_all()
+        return {'row': row, 'state': label_state, 'progress': progress,
+                'pause': button_pause, 'priority': button_priority, 'cancel': button_cancel}
+
+    def on_job_pause_clicked(self, button, job_id):
+        job = self.download_queue.jobs[job_id]
+        if job.state in (DownloadJob.PAUSED, DownloadJob.FAILED):
+            self.download_queue.resume(job_id)
+        else:
+            self.download_queue.pause(job_id)
+
+    def on_job_priority_clicked(self, button, job_id):
+        top = max(job.priority for job in self.download_queue.jobs.values())
+        self.download_queue.set_priority(job_id, top + 1)
+
+    def on_job_cancel_clicked(self, button, job_id):
+        job = self.download_queue.jobs[job_id]
+        if job.state in (DownloadJob.DONE, DownloadJob.CANCELLED):
+            self.download_queue.remove(job_id)
+            self.listbox_jobs.remove(self.job_rows.pop(job_id)['row'])
+        else:
+            self.download_queue.cancel(job_id)
 
     def open_settings(self, widget):
         dialog = Gtk.Dialog(title="Настройки", transient_for=self, flags=0)
@@ -356,6 +808,65 @@ Terminal=false
         hbox_opacity.pack_start(self.spin_opacity, True, True, 0)
         vbox.pack_start(hbox_opacity, False, False, 0)
 
+        hbox_parallel = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        label_parallel = Gtk.Label(label="Одновременных загрузок:")
+        self.spin_parallel = Gtk.SpinButton()
+        self.spin_parallel.set_range(1, 10)
+        self.spin_parallel.set_increments(1, 2)
+        self.spin_parallel.set_value(self.settings['max_parallel_downloads'])
+        hbox_parallel.pack_start(label_parallel, False, False, 0)
+        hbox_parallel.pack_start(self.spin_parallel, True, True, 0)
+        vbox.pack_start(hbox_parallel, False, False, 0)
+
+        hbox_bandwidth = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        label_bandwidth = Gtk.Label(label="Лимит скорости, КиБ/с (0 — без лимита):")
+        self.spin_bandwidth = Gtk.SpinButton()
+        self.spin_bandwidth.set_range(0, 1024 * 1024)
+        self.spin_bandwidth.set_increments(128, 1024)
+        self.spin_bandwidth.set_value(self.settings['bandwidth_limit_kib'])
+        hbox_bandwidth.pack_start(label_bandwidth, False, False, 0)
+        hbox_bandwidth.pack_start(self.spin_bandwidth, True, True, 0)
+        vbox.pack_start(hbox_bandwidth, False, False, 0)
+
+        self.check_offline = Gtk.CheckButton(label="Офлайн-режим (искать только в кэше)")
+        self.check_offline.set_active(self.settings['offline_mode'])
+        vbox.pack_start(self.check_offline, False, False, 0)
+
+        self.check_search_as_you_type = Gtk.CheckButton(label="Искать по мере ввода")
+        self.check_search_as_you_type.set_active(self.settings['search_as_you_type'])
+        vbox.pack_start(self.check_search_as_you_type, False, False, 0)
+
+        self.check_launch_cache = Gtk.CheckButton(
+            label="Быстрый запуск: распаковывать установленные приложения")
+        self.check_launch_cache.set_active(self.settings['launch_cache'])
+        vbox.pack_start(self.check_launch_cache, False, False, 0)
+        thread = threading.Thread(target=self.run_launch_usage, args=(self.check_launch_cache,))
+        thread.daemon = True
+        thread.start()
+
+        hbox_launch_limit = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        label_launch_limit = Gtk.Label(label="Место под распакованные приложения, МиБ:")
+        self.spin_launch_limit = Gtk.SpinButton()
+        self.spin_launch_limit.set_range(256, 1024 * 1024)
+        self.spin_launch_limit.set_increments(256, 1024)
+        self.spin_launch_limit.set_value(self.settings['launch_cache_limit_mb'])
+        hbox_launch_limit.pack_start(label_launch_limit, False, False, 0)
+        hbox_launch_limit.pack_start(self.spin_launch_limit, True, True, 0)
+        vbox.pack_start(hbox_launch_limit, False, False, 0)
+
+        hbox_token = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        label_token = Gtk.Label(label="Токен GitHub (необязательно):")
+        self.entry_token = Gtk.Entry()
+        self.entry_token.set_visibility(False)
+        self.entry_token.set_text(self.settings['github_token'])
+        hbox_token.pack_start(label_token, False, False, 0)
+        hbox_token.pack_start(self.entry_token, True, True, 0)
+        vbox.pack_start(hbox_token, False, False, 0)
+
+        button_clear_cache = Gtk.Button(label="Очистить кэш")
+        button_clear_cache.connect("clicked", lambda b: get_http_cache().clear())
+        vbox.pack_start(button_clear_cache, False, False, 0)
+
         dialog.show_all()
         response = dialog.run()
 
@@ -364,8 +875,27 @@ Terminal=false
             new_opacity = self.spin_opacity.get_value()
 
             if new_dir and (os.path.isdir(new_dir) or ensure_dir(new_dir)):
-                self.settings['appimage_dir'] = new_dir
+                if new_dir != self.settings['appimage_dir']:
+                    self.settings['appimage_dir'] = new_dir
+                    self.start_inventory_rescan()
                 self.settings['opacity'] = new_opacity
+                self.settings['offline_mode'] = self.check_offline.get_active()
+                self.settings['search_as_you_type'] = self.check_search_as_you_type.get_active()
+                self.settings['github_token'] = self.entry_token.get_text().strip()
+                get_rate_limiter().token = self.settings['github_token'] or os.environ.get('GITHUB_TOKEN', '')
+                get_http_cache().offline = self.settings['offline_mode']
+                self.settings['max_parallel_downloads'] = self.spin_parallel.get_value_as_int()
+                self.settings['bandwidth_limit_kib'] = self.spin_bandwidth.get_value_as_int()
+                self.download_queue.configure(self.settings['max_parallel_downloads'],
+                                              self.settings['bandwidth_limit_kib'] * 1024)
+                self.settings['launch_cache_limit_mb'] = self.spin_launch_limit.get_value_as_int()
+                get_launch_cache().max_bytes = self.settings['launch_cache_limit_mb'] * 1024 * 1024
+                if self.check_launch_cache.get_active() != self.settings['launch_cache']:
+                    self.settings['launch_cache'] = self.check_launch_cache.get_active()
+                    thread = threading.Thread(target=self.run_launch_mode_change,
+                                              args=(self.settings['launch_cache'],))
+                    thread.daemon = True
+                    thread.start()
                 self.save_settings()
                 self.apply_transparency()
                 self.update_status("Настройки сохранены.")
@@ -374,6 +904,31 @@ Terminal=false
 
         dialog.destroy()
 
+    def run_launch_usage(self, check):
+        apps, _, used = get_launch_cache().usage()
+        idle_add(self.show_launch_usage, check, apps, used)
+
+    def show_launch_usage(self, check, apps, used):
+        # Окно настроек могли закрыть раньше, чем посчитался размер кэша
+        if check.get_parent() is not None:
+            check.set_label(f"Быстрый запуск: распаковывать установленные приложения "
+                            f"(сейчас {apps}, {format_size(used)})")
+        return False
+
+    def run_launch_mode_change(self, enabled):
+        # Распаковка всех установленных приложений может занять минуты — в фоне, с прогрессом в статусе
+        def on_progress(done, total, name):
+            self.update_status(f"Быстрый запуск: распаковка {name} ({done + 1} из {total})...")
+
+        failed = set_launch_mode(enabled, on_progress=on_progress)
+        if not enabled:
+            self.update_status("Быстрый запуск выключен, ярлыки запускают сами AppImage.")
+        elif failed:
+            names = ", ".join(name for name, _ in failed)
+            self.update_status(f"Быстрый запуск включён, кроме: {names}")
+        else:
+            self.update_status("Быстрый запуск включён.")
+
     def on_browse_folder(self, button, entry):
         dialog = Gtk.FileChooserDialog(
             title="Выберите папку для AppImage",
@@ -386,6 +941,74 @@ Terminal=false
             entry.set_text(dialog.get_filename())
         dialog.destroy()
 
+    def probe_main_loop(self):
+        now = time.perf_counter()
+        lag = max(0.0, now - self.probe_expected) * 1000
+        get_tracer().observe('mainloop_lag_ms', lag)
+        get_tracer().gauge('mainloop_lag_last_ms', round(lag, 2))
+        self.probe_expected = now + MAINLOOP_PROBE_MS / 1000
+        return True
+
+    def show_debug(self, widget):
+        # Последние операции и метрики; обновляется раз в секунду, пока окно открыто
+        dialog = Gtk.Dialog(title="Отладка", transient_for=self, flags=0)
+        dialog.add_buttons("Сохранить метрики", Gtk.ResponseType.APPLY, "Закрыть", Gtk.ResponseType.CLOSE)
+        dialog.set_default_size(800, 500)
+        content = dialog.get_content_area()
+
+        check_trace = Gtk.CheckButton(label=f"Писать трассировку в файл ({TRACE_FILE})")
+        check_trace.set_active(self.settings['trace_enabled'])
+        check_trace.connect("toggled", self.on_trace_toggled)
+        content.pack_start(check_trace, False, False, 0)
+
+        notebook = Gtk.Notebook()
+        spans_store = Gtk.ListStore(str, str, str, str, str)
+        spans_view = Gtk.TreeView(model=spans_store)
+        for i, title in enumerate(["Время", "Операция", "мс", "Статус", "Подробности"]):
+            spans_view.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=i))
+        scrolled_spans = Gtk.ScrolledWindow()
+        scrolled_spans.add(spans_view)
+        notebook.append_page(scrolled_spans, Gtk.Label(label="Операции"))
+        metrics_view = Gtk.TextView(editable=False, monospace=True)
+        scrolled_metrics = Gtk.ScrolledWindow()
+        scrolled_metrics.add(metrics_view)
+        notebook.append_page(scrolled_metrics, Gtk.Label(label="Метрики"))
+        content.pack_start(notebook, True, True, 0)
+
+        def refresh():
+            spans_store.clear()
+            for span in reversed(get_tracer().recent()):
+                details = ', '.join(f"{k}={v}" for k, v in span.items()
+                                    if k not in ('name', 'ts', 'ms', 'status', 'error'))
+                if span['error']:
+                    details = f"{span['error']}; {details}"
+                spans_store.append([time.strftime('%H:%M:%S', time.localtime(span['ts'])), span['name'],
+                                    f"{span['ms']:.1f}", span['status'], details])
+            metrics_view.get_buffer().set_text(get_tracer().prometheus_text())
+            return True
+
+        refresh()
+        timer = GLib.timeout_add(DEBUG_REFRESH_MS, refresh)
+        dialog.show_all()
+        while dialog.run() == Gtk.ResponseType.APPLY:
+            try:
+                self.update_status(f"Метрики сохранены: {get_tracer().write_prometheus()}")
+            except OSError as e:
+                self.update_status(f"Не удалось сохранить метрики: {e}")
+        GLib.source_remove(timer)
+        dialog.destroy()
+
+    def on_trace_toggled(self, button):
+        self.settings['trace_enabled'] = button.get_active()
+        try:
+            if self.settings['trace_enabled']:
+                get_tracer().enable_trace_file()
+            else:
+                get_tracer().disable_trace_file()
+        except OSError as e:
+            self.update_status(f"Не удалось открыть файл трассировки: {e}")
+        self.save_settings()
+
     def show_about(self, widget):
         dialog = Gtk.AboutDialog()
         dialog.set_program_name("Void Community AppImage Helper")
@@ -402,10 +1025,8 @@ Terminal=false
 
     def save_settings(self):
         try:
-            ensure_dir(CONFIG_DIR)
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(self.settings, f, indent=4)
-        except IOError as e:
+            save_settings(self.settings)
+        except OSError as e:
             self.update_status(f"Настройки не удалось сохранить: {e}")
 
     def apply_transparency(self):
@@ -420,47 +1041,19 @@ Terminal=false
 
     def initialize_app_directory(self):
         ensure_dir(self.settings['appimage_dir'])
-        ensure_dir(APP_DIR)
         ensure_dir(ICON_BASE_DIR)
-    def create_desktop_entry(self, appimage_path, name, icon_url):
-        desktop_filename = f"{name.replace(' ', '_').lower()}.desktop"
-        desktop_path = os.path.expanduser(f"~/.local/share/applications/{desktop_filename}")
-
-        icon_path = "application-x-executable"
-        if icon_url:
-            icon_filename = f"{name.replace(' ', '_').lower()}.png"
-            icon_path = os.path.join(ICON_BASE_DIR, icon_filename)
-            try:
-                response = requests.get(icon_url, timeout=10)
-                if response.status_code == 200:
-                    ensure_dir(ICON_BASE_DIR)
-                    with open(icon_path, 'wb') as f:
-                        f.write(response.content)
-                    subprocess.run(['gtk-update-icon-cache', '-f', os.path.expanduser('~/.local/share/icons/hicolor')], capture_output=True)
-                    icon_path = icon_filename
-            except Exception as e:
-                print(f"Ошибка загрузки иконки: {e}")
-                icon_path = "application-x-executable"
-
-        desktop_content = f"""[Desktop Entry]
-Name={name}
-Exec={appimage_path}
-Icon={icon_path}
-Type=Application
-Categories=Utility;
-Comment=Запустить {name} через AppImage
-Terminal=false
-"""
-
-        try:
-            ensure_dir(os.path.dirname(desktop_path))
-            with open(desktop_path, 'w') as f:
-                f.write(desktop_content)
-            subprocess.run(['update-desktop-database', os.path.expanduser('~/.local/share/applications')], capture_output=True)
-        except Exception as e:
-            self.update_status(f"Не удалось создать .desktop файл: {e}")
 
-if __name__ == "__main__":
+def main():
     app = AppImageManager()
     app.window.show_all()
     Gtk.main()
+    # Отложенное обновление кэшей не должно потеряться при выходе
+    get_cache_refresher().flush()
+    if app.settings['trace_enabled']:
+        try:
+            get_tracer().write_prometheus()
+        except OSError:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3557 @@
+# -*- coding: utf-8 -*-
+# Void Community AppImage Helper — ядро без GTK: поиск, загрузка, установка, обновления
+# Используется и окном (appimages.py), и консольным помощником (appimages_helper.py)
+
+import os
+import json
+import time
+import logging
+import hashlib
+import importlib
+import sqlite3
+import heapq
+import itertools
+import operator
+import struct
+import mmap
+import fnmatch
+import re
+import zlib
+import lzma
+from xml.etree import ElementTree
+import threading
+import subprocess
+import shutil
+import shlex
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import quote, urljoin, urlparse
+from pathlib import Path
+
+# Диагностика — в stderr через logging: stdout консольного помощника бывает машиночитаемым (--json)
+log = logging.getLogger('appimages')
+
+class LazyModule:
+    # Тяжёлые модули (requests, gi) импортируются при первом обращении,
+    # чтобы консольные команды вроде `list` запускались быстро
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = LazyModule('requests')
+requests_adapters = LazyModule('requests.adapters')
+urllib3_exceptions = LazyModule('urllib3.exceptions')
+
+def load_gdk_pixbuf():
+    # GdkPixbuf нужен только для масштабирования иконок; без него PNG кладутся как есть
+    try:
+        import gi
+        gi.require_version('GdkPixbuf', '2.0')
+        from gi.repository import GdkPixbuf
+        return GdkPixbuf
+    except (ImportError, ValueError):
+        return None
+
+def load_numpy():
+    # numpy ускоряет поиск совпадающих блоков при дельта-обновлении; без него — итераторы stdlib
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+# --- Константы ---
+CONFIG_DIR = os.path.expanduser("~/.config/appimages")
+CONFIG_FILE = os.path.join(CONFIG_DIR, "settings.json")
+ICON_THEME_DIR = os.path.expanduser("~/.local/share/icons/hicolor")
+ICON_BASE_DIR = os.path.join(ICON_THEME_DIR, "128x128", "apps")
+DESKTOP_ENTRY_DIR = os.path.expanduser("~/.local/share/applications")
+DEFAULT_APPIMAGE_DIR = os.path.expanduser("~/AppImages")
+
+APPIMAGEHUB_API = "https://appimage.github.io/api/applications/"
+GITHUB_API = "https://api.github.com"
+HTTP_TIMEOUT = 10
+GITHUB_REPO_LIMIT = 5
+# Пул для параллельного поиска: два источника + резолв релизов GitHub
+SEARCH_WORKERS = 2 + GITHUB_REPO_LIMIT
+# Поиск по мере ввода: пауза после последнего нажатия и минимальная длина запроса
+SEARCH_DEBOUNCE_MS = 350
+SEARCH_MIN_CHARS = 2
+HTTP_POOL_SIZE = 16
+
+# --- Кэш HTTP ---
+HTTP_CACHE_DIR = os.path.join(CONFIG_DIR, "cache", "http")
+HTTP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Время жизни ответов по типу запроса (секунды)
+TTL_APPIMAGEHUB = 6 * 3600
+TTL_GITHUB_SEARCH = 30 * 60
+TTL_GITHUB_RELEASE = 60 * 60
+
+# --- Иконки результатов ---
+ICON_CACHE_DIR = os.path.join(CONFIG_DIR, "cache", "icons")
+ICON_DISK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ICON_MEMORY_CACHE_SIZE = 256
+ICON_SIZE = 48
+ICON_WORKERS = 4
+# Сколько можно ждать сброса лимита GitHub в пакетном режиме, прежде чем отложить запрос
+RATE_LIMIT_MAX_WAIT = 90
+UPDATE_CHECK_WORKERS = 4
+
+# --- Локальный каталог AppImageHub ---
+APPIMAGEHUB_FEED = "https://appimage.github.io/feed.json"
+APPIMAGEHUB_DATABASE = "https://appimage.github.io/database/"
+CATALOG_DB = os.path.join(CONFIG_DIR, "catalog.sqlite")
+CATALOG_MAX_AGE = 24 * 3600
+CATALOG_RESULT_LIMIT = 50
+
+# --- Загрузка ---
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_MIN_SEGMENT = 4 * 1024 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_STATE_INTERVAL = 1.0
+DEFAULT_MAX_PARALLEL_DOWNLOADS = 2
+DOWNLOAD_BUFFER_SIZE = 256 * 1024
+PROGRESS_UPDATES_PER_SEC = 10
+VERIFIED_FILE = os.path.join(CONFIG_DIR, "verified.json")
+INVENTORY_DB = os.path.join(CONFIG_DIR, "inventory.sqlite")
+
+# --- Иконки установленных приложений ---
+ICON_STORE_PREFIX = "appimage-"
+ICON_STORE_SIZES = (32, 48, 64, 128, 256)
+ICON_MAX_BYTES = 4 * 1024 * 1024
+# Сиротские иконки моложе этого срока не удаляются (их установка ещё идёт)
+ICON_ORPHAN_GRACE = 10 * 60
+CACHE_REFRESH_DELAY = 2.0
+
+# --- Быстрый запуск ---
+LAUNCH_CACHE_DIR = os.path.join(CONFIG_DIR, "cache", "launch")
+LAUNCH_CACHE_MAX_MB = 4096
+LAUNCH_EXTRACT_TIMEOUT = 600
+
+# --- Дельта-обновления ---
+# Внешние программы zsync в порядке предпочтения: они быстрее поиска блоков на Python
+ZSYNC_TOOLS = ('zsync2', 'zsync', 'appimageupdatetool')
+# Блок засчитывается, если слабые суммы совпали у него и у стольких следующих блоков подряд
+ZSYNC_CHAIN = 3
+ZSYNC_SCAN_CHUNK = 1024 * 1024
+
+# --- Трассировка ---
+TRACE_FILE = os.path.join(CONFIG_DIR, "trace.jsonl")
+METRICS_FILE = os.path.join(CONFIG_DIR, "metrics.prom")
+TRACE_BUFFER_SIZE = 500
+# Границы корзин гистограмм длительности (мс)
+TRACE_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+def ensure_dir(path):
+    try:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return True
+    except Exception:
+        return False
+
+def evict_lru_files(directory, max_bytes):
+    # Дисковый LRU: время последнего доступа хранится в mtime файла
+    try:
+        entries = []
+        total = 0
+        with os.scandir(directory) as it:
+            for de in it:
+                if de.is_file() and not de.name.endswith('.tmp'):
+                    st = de.stat()
+                    entries.append((st.st_mtime, st.st_size, de.path))
+                    total += st.st_size
+    except OSError:
+        return
+    if total <= max_bytes:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+# --- Трассировка и метрики ---
+class Span:
+    # Одна операция: имя, атрибуты (байты, статус, попадание в кэш...) и длительность
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.status = 'ok'
+        self.error = ''
+        self.duration_ms = 0.0
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {'name': self.name, 'ts': round(self.started_at, 3), 'ms': round(self.duration_ms, 2),
+                'status': self.status, 'error': self.error, **self.attrs}
+
+class Tracer:
+    # Последние спаны держатся в памяти (для окна отладки), по желанию пишутся
+    # в JSON Lines; счётчики, гистограммы и датчики отдаются в текстовом формате Prometheus.
+    # Всё потокобезопасно: спаны завершаются в рабочих потоках.
+    def __init__(self, buffer_size=TRACE_BUFFER_SIZE):
+        self.spans = deque(maxlen=buffer_size)
+        self.trace_path = None
+        self._trace_file = None
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def enable_trace_file(self, path=TRACE_FILE):
+        with self._lock:
+            if self._trace_file:
+                self._trace_file.close()
+            ensure_dir(os.path.dirname(path))
+            self._trace_file = open(path, 'a', buffering=1)
+            self.trace_path = path
+
+    def disable_trace_file(self):
+        with self._lock:
+            if self._trace_file:
+                self._trace_file.close()
+            self._trace_file = None
+            self.trace_path = None
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = Span(name, attrs)
+        try:
+            yield span
+        except (DownloadCancelled, SearchCancelled):
+            span.status = 'cancelled'
+            raise
+        except Exception as e:
+            span.status = 'error'
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.finish(span)
+
+    def finish(self, span):
+        span.duration_ms = (time.perf_counter() - span._t0) * 1000
+        self.observe('span_duration_ms', span.duration_ms, span=span.name, status=span.status)
+        record = span.to_dict()
+        with self._lock:
+            self.spans.append(record)
+            if self._trace_file:
+                self._trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def error(self, where, exc):
+        # Ошибка, которая не ломает операцию, но должна быть видна (раньше — только print)
+        self.inc('errors_total', where=where, type=type(exc).__name__)
+        span = Span(where, {})
+        span.status = 'error'
+        span.error = f"{type(exc).__name__}: {exc}"
+        self.finish(span)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def gauge_add(self, name, delta, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(TRACE_BUCKETS_MS), 0, 0.0]
+            for i, bound in enumerate(TRACE_BUCKETS_MS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    def recent(self, limit=100):
+        with self._lock:
+            return list(self.spans)[-limit:]
+
+    def prometheus_text(self):
+        def labels_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ''
+            escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+        lines = []
+        typed = set()
+        for kind, metrics in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in sorted(metrics.items()):
+                metric = f"appimages_{name}"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    typed.add(metric)
+                lines.append(f"{metric}{labels_text(labels)} {value}")
+        for (name, labels), (buckets, count, total) in sorted(histograms.items()):
+            metric = f"appimages_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, value in zip(TRACE_BUCKETS_MS, buckets):
+                lines.append(f"{metric}_bucket{labels_text(labels, [('le', bound)])} {value}")
+            lines.append(f"{metric}_bucket{labels_text(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{metric}_sum{labels_text(labels)} {round(total, 3)}")
+            lines.append(f"{metric}_count{labels_text(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=METRICS_FILE):
+        ensure_dir(os.path.dirname(path))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+_tracer = Tracer()
+
+def get_tracer():
+    return _tracer
+
+# Время установки соединений, замеренное в текущем потоке во время запроса
+_connection_timings = threading.local()
+
+def _note_connection(connect_s, tls_s):
+    events = getattr(_connection_timings, 'events', None)
+    if events is not None:
+        events.append((connect_s, tls_s))
+
+def make_traced_adapter(**kwargs):
+    # HTTPAdapter, соединения которого засекают TCP-подключение (вместе с DNS) и TLS.
+    # Классы строятся при первом вызове: requests и urllib3 импортируются лениво.
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(base):
+        class TimedConnection(base):
+            def _new_conn(self):
+                started = time.perf_counter()
+                conn = super()._new_conn()
+                self._tcp_seconds = time.perf_counter() - started
+                return conn
+
+            def connect(self):
+                self._tcp_seconds = 0.0
+                started = time.perf_counter()
+                super().connect()
+                total = time.perf_counter() - started
+                _note_connection(self._tcp_seconds, max(0.0, total - self._tcp_seconds))
+        return TimedConnection
+
+    class TimedHTTPPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    class TracedAdapter(requests_adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **pool_kwargs):
+            super().init_poolmanager(*args, **pool_kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPPool, 'https': TimedHTTPSPool}
+
+    return TracedAdapter(**kwargs)
+
+def traced_get(session, url, span, **kwargs):
+    # session.get с разбивкой времени в span: подключение, TLS, до первого байта, передача
+    _connection_timings.events = []
+    started = time.perf_counter()
+    try:
+        response = session.get(url, **kwargs)
+    finally:
+        events = _connection_timings.events
+        _connection_timings.events = None
+    total_ms = (time.perf_counter() - started) * 1000
+    elapsed = getattr(response, 'elapsed', None)
+    attrs = {'http_status': response.status_code, 'new_connection': bool(events)}
+    if events:
+        attrs['connect_ms'] = round(sum(e[0] for e in events) * 1000, 2)
+        attrs['tls_ms'] = round(sum(e[1] for e in events) * 1000, 2)
+    if elapsed is not None:
+        attrs['ttfb_ms'] = round(elapsed.total_seconds() * 1000, 2)
+        if not kwargs.get('stream') or isinstance(response, BufferedResponse):
+            attrs['transfer_ms'] = round(max(0.0, total_ms - attrs['ttfb_ms']), 2)
+    span.set(**attrs)
+    return response
+
+# --- Сеть ---
+_http_session = None
+_http_session_lock = threading.Lock()
+
+class RateLimited(Exception):
+    def __init__(self, reset_at):
+        super().__init__(f"Лимит запросов GitHub исчерпан до {time.strftime('%H:%M:%S', time.localtime(reset_at))}")
+        self.reset_at = reset_at
+
+class GitHubRateLimiter:
+    # Следит за X-RateLimit-Remaining/X-RateLimit-Reset и Retry-After.
+    # Перед запросом к API ждёт, пока лимит не восстановится (не дольше max_wait),
+    # иначе поднимает RateLimited — вызывающий откладывает запрос, а не считает его ошибкой.
+    # Лимиты у GitHub раздельные: поиск — 30 запросов в минуту, остальное API (core) — 5000 в час,
+    # поэтому состояние хранится по ресурсу из X-RateLimit-Resource.
+    def __init__(self):
+        self.buckets = {}
+        self.token = os.environ.get('GITHUB_TOKEN', '')
+        self._lock = threading.Lock()
+
+    def auth_headers(self):
+        return {'Authorization': f"Bearer {self.token}"} if self.token else {}
+
+    @staticmethod
+    def resource_for(url):
+        # Ресурс лимита по адресу запроса — когда ответа с X-RateLimit-Resource ещё не было
+        return 'search' if '/search/' in urlparse(url).path else 'core'
+
+    def blocked_until(self, url):
+        with self._lock:
+            remaining, reset_at = self.buckets.get(self.resource_for(url), (None, 0.0))
+            if remaining is not None and remaining <= 0 and reset_at > time.time():
+                return reset_at
+            return 0.0
+
+    def acquire(self, url, max_wait=0):
+        reset_at = self.blocked_until(url)
+        if not reset_at:
+            return
+        delay = reset_at - time.time()
+        if delay > max_wait:
+            raise RateLimited(reset_at)
+        time.sleep(max(delay, 0))
+
+    def observe(self, response, url):
+        headers = response.headers
+        resource = headers.get('X-RateLimit-Resource') or self.resource_for(url)
+        with self._lock:
+            remaining, reset_at = self.buckets.get(resource, (None, 0.0))
+            if headers.get('X-RateLimit-Remaining', '').isdigit():
+                remaining = int(headers['X-RateLimit-Remaining'])
+            if headers.get('X-RateLimit-Reset', '').isdigit():
+                reset_at = float(headers['X-RateLimit-Reset'])
+            if response.status_code in (403, 429):
+                retry_after = headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    remaining = 0
+                    reset_at = max(reset_at, time.time() + int(retry_after))
+                elif remaining is None:
+                    # Вторичный лимит без подсказки — минута паузы, как советует документация GitHub
+                    remaining = 0
+                    reset_at = time.time() + 60
+            self.buckets[resource] = (remaining, reset_at)
+
+_rate_limiter = GitHubRateLimiter()
+
+def get_rate_limiter():
+    return _rate_limiter
+
+def get_http_session():
+    # Одна сессия на процесс: keep-alive и общий пул соединений,
+    # чтобы не платить за TLS-рукопожатие на каждый запрос
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = make_traced_adapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['User-Agent'] = 'appimages-helper/1.0'
+            _http_session = session
+        return _http_session
+
+class HttpCache:
+    # Дисковый кэш JSON-ответов: TTL на запись, ревалидация по ETag/Last-Modified,
+    # вытеснение по LRU (время доступа = mtime файла записи) при превышении лимита.
+    # Если сеть недоступна или включён офлайн-режим — отдаём устаревшие записи.
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = False
+        self._lock = threading.Lock()
+
+    def _entry_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + ".json")
+
+    def load(self, url):
+        path = self._entry_path(url)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, url, entry):
+        entry['url'] = url
+        path = self._entry_path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            ensure_dir(self.cache_dir)
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            evict_lru_files(self.cache_dir, self.max_bytes)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def get_json(self, url, ttl, session=None, max_wait=0):
+        # Возвращает (status_code, data). 304 и устаревшие записи отдаются как 200.
+        # max_wait — сколько секунд можно ждать сброса лимита GitHub
+        tracer = get_tracer()
+        with tracer.span('http.get_json', url=url) as span:
+            result = self._get_json(url, ttl, session, max_wait, span)
+        tracer.inc('http_requests_total', cache=span.attrs.get('cache', ''),
+                   status=span.attrs.get('http_status', ''))
+        tracer.inc('http_bytes_total', span.attrs.get('bytes', 0))
+        return result
+
+    def _get_json(self, url, ttl, session, max_wait, span):
+        entry = self.load(url)
+        now = time.time()
+        if entry and (self.offline or now - entry.get('stored_at', 0) < ttl):
+            span.set(cache='hit')
+            return 200, json.loads(entry['body'])
+        if self.offline:
+            raise requests.ConnectionError(f"Офлайн-режим: нет данных в кэше для {url}")
+
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        session = session or get_http_session()
+        limiter = get_rate_limiter() if url.startswith(GITHUB_API) else None
+        if limiter:
+            headers.update(limiter.auth_headers())
+        for attempt in range(2):
+            try:
+                if limiter:
+                    limiter.acquire(url, max_wait)
+                span.set(retries=attempt)
+                response = traced_get(session, url, span, headers=headers, timeout=HTTP_TIMEOUT)
+            except RateLimited:
+                if entry:
+                    span.set(cache='stale')
+                    return 200, json.loads(entry['body'])
+                raise
+            except requests.RequestException:
+                if entry:
+                    span.set(cache='stale')
+                    return 200, json.loads(entry['body'])
+                raise
+            if not limiter:
+                break
+            limiter.observe(response, url)
+            # 403/429 из-за лимита: одна повторная попытка после ожидания, если его можно себе позволить
+            if response.status_code not in (403, 429) or not limiter.blocked_until(url):
+                break
+
+        span.set(bytes=len(response.content))
+        if response.status_code == 304 and entry:
+            span.set(cache='revalidated')
+            entry['stored_at'] = now
+            self.store(url, entry)
+            return 200, json.loads(entry['body'])
+        span.set(cache='miss')
+        if response.status_code == 200:
+            self.store(url, {
+                'stored_at': now,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'body': response.text,
+            })
+            return 200, response.json()
+        # Ошибки сервера и исчерпанный лимит GitHub (403/429) — лучше старые данные, чем никаких
+        if entry and (response.status_code in (403, 429) or response.status_code >= 500):
+            span.set(cache='stale')
+            return 200, json.loads(entry['body'])
+        return response.status_code, None
+
+_http_cache = None
+
+def get_http_cache():
+    global _http_cache
+    with _http_session_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache()
+        return _http_cache
+
+def search_appimagehub(query, session=None):
+    results = []
+    status, data = get_http_cache().get_json(
+        f"{APPIMAGEHUB_API}?search={quote(query)}", TTL_APPIMAGEHUB, session)
+    if status == 200:
+        for item in data.get('results', []):
+            name = item.get('name', 'Без названия')
+            description = item.get('description', 'Нет описания')
+            download_url = item.get('download_url', '')
+            icon_url = item.get('icon_url', '')
+            if download_url and download_url.endswith('.AppImage'):
+                results.append({
+                    'name': name,
+                    'description': description,
+                    'url': download_url,
+                    'icon_url': icon_url,
+                    'source': 'AppImageHub'
+                })
+    return results
+
+def search_github_repos(query, session=None):
+    gh_url = f"{GITHUB_API}/search/repositories?q={quote(query)}+AppImage+in:name,description"
+    status, data = get_http_cache().get_json(gh_url, TTL_GITHUB_SEARCH, session)
+    if status != 200:
+        return []
+    return data.get('items', [])[:GITHUB_REPO_LIMIT]
+
+def parse_asset_digest(digest):
+    # GitHub отдаёт дайджест ассета как "sha256:<hex>"
+    if digest and ':' in digest:
+        algorithm, value = digest.split(':', 1)
+        return {algorithm.lower(): value.lower()}
+    return {}
+
+def get_github_appimage_asset(repo_url, session=None, max_wait=0):
+    # Возвращает {'url', 'digests', 'zsync_url'} для AppImage из последнего релиза.
+    # RateLimited пробрасывается — это не «нет AppImage», а «спросить позже».
+    try:
+        api_url = repo_url.replace('https://github.com', f'{GITHUB_API}/repos') + '/releases/latest'
+        status, release = get_http_cache().get_json(api_url, TTL_GITHUB_RELEASE, session, max_wait)
+        if status == 200:
+            assets = release.get('assets', [])
+            urls = {asset.get('browser_download_url', '') for asset in assets}
+            for asset in assets:
+                download_url = asset.get('browser_download_url', '')
+                if download_url.endswith('.AppImage'):
+                    zsync_url = download_url + '.zsync'
+                    return {
+                        'url': download_url,
+                        'digests': parse_asset_digest(asset.get('digest')),
+                        'zsync_url': zsync_url if zsync_url in urls else '',
+                    }
+    except RateLimited:
+        raise
+    except (requests.RequestException, ValueError) as e:
+        get_tracer().error('github.release', e)
+    return None
+
+def get_github_appimage_link(repo_url, session=None):
+    asset = get_github_appimage_asset(repo_url, session)
+    return asset['url'] if asset else None
+
+def _trigrams(text):
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def edit_distance(a, b, limit):
+    # Расстояние Дамерау — Левенштейна (перестановка соседних букв — одна правка);
+    # при превышении limit считать дальше незачем — возвращается limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+        prev2, prev = prev, row
+    return min(prev[-1], limit + 1)
+
+def typo_distance(query, name):
+    # Короткие запросы почти не делят триграмм с названием даже при одной опечатке
+    # ("krtia" и "krita"), поэтому сравниваются правками: со всем названием,
+    # его отдельными словами и началом той же длины (поиск по мере ввода)
+    limit = 1 if len(query) < 7 else 2
+    if len(query) < 4:
+        return limit + 1
+    words = [w for w in re.split(r'[\W_]+', name) if w]
+    candidates = {name, name[:len(query)], *words, *(w[:len(query)] for w in words)}
+    return min(edit_distance(query, c, limit) for c in candidates)
+
+def match_score(query, name, description=''):
+    # Ранжирование: точное совпадение > префикс > подстрока > похожесть
+    # по триграммам и опечатки в одну-две буквы > совпадение в описании
+    q = query.lower().strip()
+    n = name.lower()
+    if not q:
+        return 0.0
+    if n == q:
+        return 100.0
+    if n.startswith(q):
+        return 80.0 + 10.0 * len(q) / max(len(n), 1)
+    if q in n:
+        return 60.0 + 10.0 * len(q) / max(len(n), 1)
+    q_grams = _trigrams(q)
+    n_grams = _trigrams(n)
+    similarity = len(q_grams & n_grams) / max(len(q_grams | n_grams), 1)
+    score = 50.0 * similarity if similarity >= 0.3 else 0.0
+    if ' ' not in q and len(q) <= 12:
+        distance = typo_distance(q, n)
+        if distance <= (1 if len(q) < 7 else 2):
+            score = max(score, 50.0 - 10.0 * distance)
+    words = q.split()
+    d = (description or '').lower()
+    if words and all(w in n or w in d for w in words):
+        score = max(score, 30.0 if q in d else 20.0)
+    return score
+
+class CatalogIndex:
+    # Локальная копия каталога AppImageHub (feed.json) в SQLite.
+    # Синхронизация инкрементальная: условный GET по ETag, в базе
+    # обновляются только изменившиеся записи (по хешу содержимого).
+    # Поиск идёт по триграммному индексу в памяти — без сети, за миллисекунды.
+    def __init__(self, db_path=CATALOG_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._apps = None
+        self._name_grams = {}
+        self._words = {}
+
+    def _connect(self):
+        ensure_dir(os.path.dirname(self.db_path))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS apps (
+            name TEXT PRIMARY KEY,
+            description TEXT,
+            repo_url TEXT,
+            download_page TEXT,
+            icon_url TEXT,
+            digest TEXT)""")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return conn
+
+    def _get_meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_stale(self):
+        try:
+            conn = self._connect()
+            try:
+                synced_at = float(self._get_meta(conn, 'synced_at', 0))
+            finally:
+                conn.close()
+        except (sqlite3.Error, ValueError):
+            return True
+        return time.time() - synced_at > CATALOG_MAX_AGE
+
+    def is_populated(self):
+        return bool(self._load())
+
+    @staticmethod
+    def _parse_feed_item(item):
+        name = item.get('name')
+        if not name:
+            return None
+        repo_url = ''
+        download_page = ''
+        for link in item.get('links') or []:
+            if link.get('type') == 'GitHub' and link.get('url'):
+                repo_url = f"https://github.com/{link['url'].strip('/')}"
+            elif link.get('type') == 'Download':
+                download_page = link.get('url', '')
+        # У многих записей вместо ссылки GitHub — «Download» на страницу релизов того же репозитория
+        match = re.match(r'https?://github\.com/([^/]+/[^/#?]+)', download_page)
+        if not repo_url and match:
+            repo_url = f"https://github.com/{match.group(1)}"
+        icons = item.get('icons') or []
+        icon_url = APPIMAGEHUB_DATABASE + icons[0] if icons else ''
+        row = (name, item.get('description') or 'Нет описания', repo_url, download_page, icon_url)
+        digest = hashlib.sha1(json.dumps(row).encode('utf-8')).hexdigest()
+        return row + (digest,)
+
+    def sync(self, session=None):
+        # Возвращает число добавленных/изменённых записей (0 при 304)
+        with get_tracer().span('catalog.sync') as span:
+            changed = self._sync(session or get_http_session(), span)
+            span.set(changed=changed)
+        return changed
+
+    def _sync(self, session, span):
+        conn = self._connect()
+        try:
+            headers = {}
+            etag = self._get_meta(conn, 'etag')
+            if etag:
+                headers['If-None-Match'] = etag
+            response = traced_get(session, APPIMAGEHUB_FEED, span, headers=headers, timeout=HTTP_TIMEOUT * 3)
+            span.set(bytes=len(response.content))
+            if response.status_code == 304:
+                with conn:
+                    self._set_meta(conn, 'synced_at', str(time.time()))
+                return 0
+            response.raise_for_status()
+
+            rows = {}
+            for item in response.json().get('items', []):
+                row = self._parse_feed_item(item)
+                if row:
+                    rows[row[0]] = row
+            known = dict(conn.execute("SELECT name, digest FROM apps"))
+            changed = [row for name, row in rows.items() if known.get(name) != row[-1]]
+            removed = [(name,) for name in known if name not in rows]
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO apps VALUES (?, ?, ?, ?, ?, ?)", changed)
+                conn.executemany("DELETE FROM apps WHERE name = ?", removed)
+                self._set_meta(conn, 'etag', response.headers.get('ETag') or '')
+                self._set_meta(conn, 'synced_at', str(time.time()))
+        finally:
+            conn.close()
+        if changed or removed:
+            with self._lock:
+                self._apps = None
+        return len(changed)
+
+    def _load(self):
+        with self._lock:
+            if self._apps is not None:
+                return self._apps
+            try:
+                conn = self._connect()
+                try:
+                    apps = conn.execute(
+                        "SELECT name, description, repo_url, download_page, icon_url FROM apps").fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                apps = []
+            name_grams = {}
+            words = {}
+            for idx, (name, description, *_rest) in enumerate(apps):
+                for gram in _trigrams(name):
+                    name_grams.setdefault(gram, set()).add(idx)
+                for word in set(f"{name} {description}".lower().split()):
+                    words.setdefault(word, set()).add(idx)
+            self._apps, self._name_grams, self._words = apps, name_grams, words
+            return apps
+
+    def search(self, query, limit=CATALOG_RESULT_LIMIT):
+        apps = self._load()
+        q = query.lower().strip()
+        if not apps or not q:
+            return []
+        candidates = set()
+        for gram in _trigrams(q):
+            candidates |= self._name_grams.get(gram, set())
+        for token in q.split():
+            for word, ids in self._words.items():
+                if word.startswith(token):
+                    candidates |= ids
+        scored = []
+        for idx in candidates:
+            name, description, repo_url, download_page, icon_url = apps[idx]
+            score = match_score(q, name, description)
+            if score > 0:
+                scored.append((score, name, {
+                    'name': name,
+                    'description': description,
+                    'url': '',
+                    'repo_url': repo_url,
+                    'download_page': download_page,
+                    'icon_url': icon_url,
+                    'source': 'AppImageHub',
+                    'score': score
+                }))
+        scored.sort(key=lambda s: (-s[0], s[1].lower()))
+        return [item for _, _, item in scored[:limit]]
+
+_catalog = None
+
+def get_catalog():
+    global _catalog
+    with _http_session_lock:
+        if _catalog is None:
+            _catalog = CatalogIndex()
+        return _catalog
+
+def blend_results(query, local, live):
+    # Объединяет результаты каталога и живого поиска: дубли по имени
+    # схлопываются (непустые поля живого результата, в т.ч. прямая ссылка,
+    # перекрывают поля каталога), общий порядок — по match_score
+    merged = {}
+    for item in local + live:
+        key = item['name'].lower()
+        if key in merged:
+            item = {**merged[key], **{k: v for k, v in item.items() if v}}
+        if 'score' not in item:
+            item = {**item, 'score': match_score(query, item['name'], item.get('description', ''))}
+        merged[key] = item
+    return sorted(merged.values(), key=lambda i: (-i['score'], i['name'].lower()))
+
+def resolve_download_url(item, session=None):
+    # Заполняет в item ссылку и известные контрольные суммы последнего релиза
+    if item.get('url'):
+        return item['url']
+    if item.get('repo_url'):
+        asset = get_github_appimage_asset(item['repo_url'], session)
+        if asset:
+            item['digests'] = asset['digests']
+            item['zsync_url'] = asset['zsync_url']
+            return asset['url']
+    if item.get('download_page', '').endswith('.AppImage'):
+        return item['download_page']
+    if item.get('source') == 'AppImageHub':
+        return resolve_hub_url(item, session)
+    return None
+
+def resolve_hub_url(item, session=None):
+    # Запись каталога без репозитория GitHub: прямую ссылку знает только живой поиск AppImageHub
+    try:
+        for hit in search_appimagehub(item['name'], session):
+            if hit['name'].lower() == item['name'].lower():
+                return hit['url']
+    except (requests.RequestException, ValueError) as e:
+        get_tracer().error('search.hub', e)
+    return None
+
+def fetch_zsync_header(zsync_url, session=None):
+    # Заголовок .zsync (до пустой строки) — текстовые поля вида "SHA-1: <hex>"
+    session = session or get_http_session()
+    response = session.get(zsync_url, headers={'Range': 'bytes=0-4095'}, stream=True, timeout=HTTP_TIMEOUT)
+    with response:
+        response.raise_for_status()
+        head = response.raw.read(4096)
+    header = {}
+    for line in head.split(b'\n'):
+        if not line.strip():
+            break
+        key, _, value = line.decode('utf-8', 'replace').partition(':')
+        header[key.strip()] = value.strip()
+    return header
+
+def expected_digests(item, session=None):
+    # Опубликованные суммы: дайджест ассета GitHub и SHA-1 из zsync-файла обновления
+    digests = dict(item.get('digests') or {})
+    if item.get('zsync_url') and 'sha1' not in digests:
+        try:
+            sha1 = fetch_zsync_header(item['zsync_url'], session).get('SHA-1')
+            if sha1:
+                digests['sha1'] = sha1.lower()
+        except (requests.RequestException, OSError):
+            pass
+    return digests
+
+class IntegrityError(Exception):
+    pass
+
+class StreamingHasher:
+    # Хеширует файл по ходу загрузки. Куски, пришедшие ровно на текущую
+    # границу, хешируются прямо из буфера; данные, записанные другими
+    # сегментами впереди границы, дочитываются из .part, пока они ещё
+    # в страничном кэше. Повторного прохода по файлу после загрузки нет.
+    def __init__(self, algorithms=('sha256',)):
+        self._hashes = {name: hashlib.new(name) for name in set(algorithms) | {'sha256'}}
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def _update(self, data):
+        for h in self._hashes.values():
+            h.update(data)
+        self.position += len(data)
+
+    def feed(self, offset, data):
+        # Не блокирует: если хешер занят другим потоком, кусок будет дочитан позже
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if offset != self.position:
+                return False
+            self._update(data)
+            return True
+        finally:
+            self._lock.release()
+
+    def catch_up(self, fd, frontier, blocking=False):
+        if not self._lock.acquire(blocking=blocking):
+            return
+        try:
+            while self.position < frontier:
+                data = os.pread(fd, min(DOWNLOAD_BUFFER_SIZE, frontier - self.position), self.position)
+                if not data:
+                    break
+                self._update(data)
+        finally:
+            self._lock.release()
+
+    def hexdigests(self):
+        with self._lock:
+            return {name: h.hexdigest() for name, h in self._hashes.items()}
+
+def check_digests(actual, expected):
+    # Ожидаемая сумма, которую не с чем сравнить, — тоже ошибка, а не молчаливый успех
+    for name, value in expected.items():
+        if name not in actual:
+            raise IntegrityError(f"Контрольная сумма {name.upper()} не посчитана, сравнить не с чем")
+        if actual[name] != value:
+            raise IntegrityError(f"Контрольная сумма {name.upper()} не совпадает: "
+                                 f"ожидалось {value}, получено {actual[name]}")
+
+def hash_file(path, algorithms=('sha256',)):
+    hasher = StreamingHasher(algorithms)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        hasher.catch_up(fd, os.fstat(fd).st_size, blocking=True)
+    finally:
+        os.close(fd)
+    return hasher.hexdigests()
+
+class VerificationRecords:
+    # Результаты проверок по пути файла вместе с размером и mtime:
+    # неизменённый файл при повторной проверке не перечитывается
+    def __init__(self, path=VERIFIED_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, filepath, digests):
+        st = os.stat(filepath)
+        with self._lock:
+            records = self._load()
+            records[filepath] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digests': digests}
+            ensure_dir(os.path.dirname(self.path))
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(records, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def lookup(self, filepath):
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._load().get(filepath)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['digests']
+        return None
+
+    def verify(self, filepath, expected=None):
+        # Алгоритмы, которых нет в записи, досчитываются — запись с одним sha256
+        # не должна засчитывать ожидаемый sha1 без проверки
+        expected = expected or {}
+        digests = self.lookup(filepath)
+        missing = tuple(name for name in expected if name not in (digests or {}))
+        if digests is None or missing:
+            digests = {**(digests or {}), **hash_file(filepath, missing)}
+            self.record(filepath, digests)
+        check_digests(digests, expected)
+        return digests
+
+_verification_records = None
+
+def get_verification_records():
+    global _verification_records
+    with _http_session_lock:
+        if _verification_records is None:
+            _verification_records = VerificationRecords()
+        return _verification_records
+
+class DownloadCancelled(Exception):
+    pass
+
+def iter_response_into(response, buffer):
+    # Читает тело ответа в один переиспользуемый буфер вместо нового
+    # объекта bytes на каждый кусок. Отдаёт memoryview, действительный
+    # до следующей итерации. Сжатые ответы читаются через iter_content.
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        yield from response.iter_content(chunk_size=len(buffer))
+        return
+    view = memoryview(buffer)
+    while True:
+        try:
+            n = response.raw.readinto(view)
+        except urllib3_exceptions.HTTPError as e:
+            raise requests.ConnectionError(e)
+        if not n:
+            return
+        yield view[:n]
+
+def format_size(nbytes):
+    for unit in ("Б", "КиБ", "МиБ"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "Б" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} ГиБ"
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+class TransferStats:
+    # Счётчики передачи: update() вызывается из потоков загрузки,
+    # sample() — из того, кто публикует прогресс (UI), не чаще нескольких раз в секунду
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.done = 0
+        self.total = 0
+        self.instant = 0.0
+        self.smoothed = 0.0
+        self._sample_time = None
+        self._sample_done = 0
+
+    def update(self, done, total):
+        self.done = done
+        self.total = total
+
+    def sample(self):
+        now = time.monotonic()
+        done = self.done
+        if self._sample_time is not None and now > self._sample_time:
+            self.instant = max(0.0, (done - self._sample_done) / (now - self._sample_time))
+            if self.smoothed:
+                self.smoothed = self.smoothing * self.instant + (1 - self.smoothing) * self.smoothed
+            else:
+                self.smoothed = self.instant
+        self._sample_time = now
+        self._sample_done = done
+
+    def reset_rate(self):
+        self.instant = self.smoothed = 0.0
+        self._sample_time = None
+
+    def eta(self):
+        if self.smoothed > 0 and self.total > self.done:
+            return (self.total - self.done) / self.smoothed
+        return None
+
+class ProgressPublisher:
+    # Копит изменения прогресса из рабочих потоков и отдаёт их одним
+    # объединённым вызовом publish(keys) не чаще max_rate раз в секунду.
+    # schedule(delay, fn) должен вызвать fn один раз через delay секунд
+    # в потоке получателя (для GTK — GLib.timeout_add).
+    def __init__(self, publish, schedule, max_rate=PROGRESS_UPDATES_PER_SEC):
+        self.publish = publish
+        self.schedule = schedule
+        self.interval = 1.0 / max_rate
+        self._dirty = set()
+        self._scheduled = False
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def touch(self, key):
+        with self._lock:
+            self._dirty.add(key)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            delay = max(0.0, self._last + self.interval - time.monotonic())
+        self.schedule(delay, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            keys, self._dirty = self._dirty, set()
+            self._scheduled = False
+            self._last = time.monotonic()
+        if keys:
+            self.publish(keys)
+        return False
+
+class SegmentedDownloader:
+    # Загрузка по HTTP Range в несколько соединений: файл .part заранее
+    # выделяется на диске, каждый сегмент пишется по своему смещению,
+    # состояние сегментов сохраняется в .part.json — прерванная загрузка
+    # продолжается с места остановки. Готовый файл атомарно переименовывается.
+    # Если сервер не поддерживает Range — обычная загрузка одним потоком.
+    def __init__(self, url, filepath, session=None, connections=DOWNLOAD_CONNECTIONS,
+                 progress_callback=None, is_cancelled=None, throttle=None, expected_digests=None):
+        self.url = url
+        self.filepath = filepath
+        self.part_path = filepath + ".part"
+        self.state_path = filepath + ".part.json"
+        self.session = session or get_http_session()
+        self.connections = max(1, connections)
+        self.progress_callback = progress_callback
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.throttle = throttle or (lambda nbytes: None)
+        self.expected_digests = expected_digests or {}
+        self.hasher = StreamingHasher(self.expected_digests.keys())
+        self.digests = {}
+        self.total_size = 0
+        self.downloaded = 0
+        self.segments = []
+        self.retries = 0
+        self.ranged_url = None
+        self._lock = threading.Lock()
+        self._url_lock = threading.Lock()
+        self._state_saved_at = 0.0
+        self._abort = threading.Event()
+
+    def _report(self, nbytes):
+        with self._lock:
+            self.downloaded += nbytes
+            downloaded = self.downloaded
+        if self.progress_callback:
+            self.progress_callback(downloaded, self.total_size)
+
+    def _check_cancelled(self):
+        if self._abort.is_set() or self.is_cancelled():
+            raise DownloadCancelled()
+
+    def _probe(self, span):
+        # Запрос первого байта: по ответу 206 узнаём размер и поддержку Range,
+        # а заодно конечный адрес после редиректов (GitHub → CDN)
+        response = traced_get(self.session, self.url, span, headers={'Range': 'bytes=0-0'},
+                              stream=True, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            response.raise_for_status()
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified') or ''
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                if total.isdigit():
+                    return response.url, int(total), validator
+            return None, int(response.headers.get('content-length', 0)), validator
+        finally:
+            response.close()
+
+    def _load_state(self, total_size, validator):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (state.get('url') != self.url or state.get('size') != total_size
+                or state.get('validator') != validator or not os.path.exists(self.part_path)
+                or os.path.getsize(self.part_path) != total_size):
+            return None
+        return state.get('segments')
+
+    def _save_state(self, validator, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._state_saved_at < DOWNLOAD_STATE_INTERVAL:
+                return
+            self._state_saved_at = now
+            state = {'url': self.url, 'size': self.total_size, 'validator': validator,
+                     'segments': [list(s) for s in self.segments]}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _plan_segments(self):
+        count = min(self.connections, max(1, -(-self.total_size // DOWNLOAD_MIN_SEGMENT)))
+        step = -(-self.total_size // count)
+        # [начало, конец включительно, уже скачано байт]
+        return [[start, min(start + step, self.total_size) - 1, 0]
+                for start in range(0, self.total_size, step)]
+
+    def _preallocate(self):
+        with open(self.part_path, 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, self.total_size)
+            except (AttributeError, OSError):
+                f.truncate(self.total_size)
+
+    def _refresh_url(self, stale_url, validator):
+        # Подписанные ссылки CDN (GitHub → objects.githubusercontent.com) живут недолго:
+        # после отказа в диапазоне конечный адрес узнаётся заново — один раз для всех
+        # сегментов, получивших отказ по той же ссылке
+        with self._url_lock:
+            if self.ranged_url != stale_url:
+                return
+            with get_tracer().span('download.probe', url=self.url, refresh=True) as span:
+                ranged_url, total_size, fresh_validator = self._probe(span)
+            if (ranged_url is None or total_size != self.total_size
+                    or (validator and fresh_validator and fresh_validator != validator)):
+                raise IOError("Файл на сервере изменился во время загрузки")
+            self.ranged_url = ranged_url
+
+    def _fetch_segment(self, index, validator):
+        segment = self.segments[index]
+        buffer = bytearray(DOWNLOAD_BUFFER_SIZE)
+        attempt = 0
+        while segment[0] + segment[2] <= segment[1]:
+            self._check_cancelled()
+            offset = segment[0] + segment[2]
+            ranged_url = self.ranged_url
+            refused = False
+            try:
+                response = self.session.get(ranged_url, headers={'Range': f"bytes={offset}-{segment[1]}"},
+                                            stream=True, timeout=DOWNLOAD_TIMEOUT)
+                with response:
+                    if response.status_code != 206:
+                        refused = True
+                        raise requests.HTTPError(f"Сервер вернул {response.status_code} на запрос диапазона")
+                    fd = os.open(self.part_path, os.O_RDWR)
+                    try:
+                        for chunk in iter_response_into(response, buffer):
+                            self._check_cancelled()
+                            if not chunk:
+                                continue
+                            chunk = chunk[:segment[1] + 1 - offset]
+                            self.throttle(len(chunk))
+                            os.pwrite(fd, chunk, offset)
+                            self.hasher.feed(offset, chunk)
+                            offset += len(chunk)
+                            segment[2] += len(chunk)
+                            self.hasher.catch_up(fd, self._contiguous_frontier())
+                            self._report(len(chunk))
+                            self._save_state(validator)
+                            if offset > segment[1]:
+                                break
+                    finally:
+                        os.close(fd)
+                # Ответ закончился без ошибки, но раньше конца диапазона — тоже неудачная попытка,
+                # иначе сервер, обрывающий ответы, зациклит загрузку
+                if offset <= segment[1]:
+                    raise requests.RequestException(
+                        f"Ответ оборвался на байте {offset} из диапазона до {segment[1]}")
+            except requests.RequestException as e:
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                get_tracer().inc('download_retries_total')
+                get_tracer().error('download.segment', e)
+                if attempt > DOWNLOAD_RETRIES:
+                    raise
+                time.sleep(attempt)
+                if refused:
+                    try:
+                        self._refresh_url(ranged_url, validator)
+                    except requests.RequestException as probe_error:
+                        get_tracer().error('download.probe', probe_error)
+
+    def _download_single(self):
+        response = self.session.get(self.url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        with response:
+            response.raise_for_status()
+            self.total_size = int(response.headers.get('content-length', 0))
+            with open(self.part_path, 'wb') as f:
+                for chunk in iter_response_into(response, bytearray(DOWNLOAD_BUFFER_SIZE)):
+                    self._check_cancelled()
+                    if chunk:
+                        self.throttle(len(chunk))
+                        f.write(chunk)
+                        self.hasher.feed(self.hasher.position, chunk)
+                        self._report(len(chunk))
+        if self.total_size and self.downloaded != self.total_size:
+            raise IOError(f"Получено {self.downloaded} из {self.total_size} байт")
+
+    def _contiguous_frontier(self):
+        # Конец непрерывно записанного от начала файла участка
+        frontier = 0
+        for start, end, done in self.segments:
+            frontier = start + done
+            if start + done <= end:
+                break
+        return frontier
+
+    def _finish_hash(self):
+        fd = os.open(self.part_path, os.O_RDONLY)
+        try:
+            self.hasher.catch_up(fd, os.fstat(fd).st_size, blocking=True)
+        finally:
+            os.close(fd)
+        self.digests = self.hasher.hexdigests()
+        try:
+            check_digests(self.digests, self.expected_digests)
+        except IntegrityError:
+            # Повреждённые данные не докачиваются — только загрузка заново
+            for path in (self.part_path, self.state_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+
+    def run(self):
+        tracer = get_tracer()
+        with tracer.span('download', url=self.url) as span:
+            self._run(tracer, span)
+            span.set(bytes=self.total_size, segments=len(self.segments), retries=self.retries)
+        tracer.inc('download_bytes_total', self.total_size)
+        return self.filepath
+
+    def _run(self, tracer, span):
+        # Фазы (проверка сервера, выделение места, передача, проверка суммы, переименование)
+        # пишутся отдельными спанами
+        ensure_dir(os.path.dirname(self.filepath))
+        with tracer.span('download.probe', url=self.url) as probe_span:
+            self.ranged_url, self.total_size, validator = self._probe(probe_span)
+        if self.ranged_url is None or self.total_size == 0:
+            with tracer.span('download.transfer', mode='single'):
+                self._download_single()
+        else:
+            segments = self._load_state(self.total_size, validator)
+            if segments:
+                self.segments = segments
+                self.downloaded = sum(s[2] for s in segments)
+                span.set(resumed_bytes=self.downloaded)
+            else:
+                self.segments = self._plan_segments()
+                with tracer.span('download.allocate', bytes=self.total_size):
+                    self._preallocate()
+            self._save_state(validator, force=True)
+            transfer_span = tracer.span('download.transfer', mode='segmented', segments=len(self.segments))
+            try:
+                with transfer_span, ThreadPoolExecutor(max_workers=len(self.segments)) as pool:
+                    futures = [pool.submit(self._fetch_segment, i, validator)
+                               for i in range(len(self.segments))]
+                    errors = []
+                    for future in as_completed(futures):
+                        try:
+                            future.result()
+                        except Exception as e:
+                            # Ошибка одного сегмента останавливает остальные
+                            self._abort.set()
+                            errors.append(e)
+                    real_errors = [e for e in errors if not isinstance(e, DownloadCancelled)]
+                    if real_errors:
+                        raise real_errors[0]
+                    if errors:
+                        raise errors[0]
+            finally:
+                self._save_state(validator, force=True)
+        with tracer.span('download.verify', bytes=self.total_size):
+            self._finish_hash()
+        with tracer.span('download.finalize'):
+            os.replace(self.part_path, self.filepath)
+            try:
+                os.remove(self.state_path)
+            except OSError:
+                pass
+
+def appimage_filename(item, url):
+    filename = url.split('/')[-1]
+    if not filename.endswith('.AppImage'):
+        filename = f"{item['name'].replace(' ', '_')}.AppImage"
+    return filename
+
+class TokenBucket:
+    # Общий ограничитель скорости для всех загрузок (байт/с, 0 — без ограничения)
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = max(0, rate)
+            self.capacity = max(self.rate, 64 * 1024)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+
+    def consume(self, amount):
+        while True:
+            with self._lock:
+                if self.rate <= 0:
+                    return
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Куски больше ёмкости корзины уходят «в долг», чтобы не зависнуть
+                if self.tokens >= min(amount, self.capacity):
+                    self.tokens -= amount
+                    return
+                wait = (min(amount, self.capacity) - self.tokens) / self.rate
+            time.sleep(min(wait, 0.25))
+
+class DownloadJob:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    CANCELLED = 'cancelled'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    _ids = itertools.count(1)
+
+    def __init__(self, item, priority=0):
+        self.id = next(self._ids)
+        self.item = dict(item)
+        self.filepath = None
+        self.priority = priority
+        self.state = self.QUEUED
+        self.stats = TransferStats()
+        self.error = None
+        self._stop = None
+        self._entry = None
+
+    def should_stop(self):
+        return self._stop is not None
+
+class DownloadQueue:
+    # Очередь загрузок: приоритеты, ограничение числа одновременных задач,
+    # пауза/отмена каждой задачи и общий лимит скорости.
+    # run_job(job) выполняет саму загрузку и установку в рабочем потоке и занимает
+    # путь файла через claim_path; on_change(job) вызывается из рабочих потоков
+    # при любом изменении задачи.
+    def __init__(self, run_job, max_parallel=DEFAULT_MAX_PARALLEL_DOWNLOADS, bandwidth_limit=0, on_change=None):
+        self.run_job = run_job
+        self.max_parallel = max(1, max_parallel)
+        self.bandwidth = TokenBucket(bandwidth_limit)
+        self.on_change = on_change or (lambda job: None)
+        self.jobs = {}
+        self._pending = []
+        self._running = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def configure(self, max_parallel, bandwidth_limit):
+        self.bandwidth.set_rate(bandwidth_limit)
+        with self._lock:
+            self.max_parallel = max(1, max_parallel)
+            self._dispatch()
+
+    def notify(self, job):
+        self.on_change(job)
+
+    @staticmethod
+    def item_key(item):
+        return item.get('url') or (item.get('repo_url') or '').lower() or item['name'].lower()
+
+    def find_active(self, item):
+        # Незавершённая задача для того же приложения (в очереди, идёт, на паузе, с ошибкой)
+        key = self.item_key(item)
+        with self._lock:
+            for job in self.jobs.values():
+                if job.state not in (DownloadJob.DONE, DownloadJob.CANCELLED) and self.item_key(job.item) == key:
+                    return job
+        return None
+
+    def submit(self, item, priority=0):
+        # Повторная постановка того же приложения возвращает уже существующую задачу
+        existing = self.find_active(item)
+        if existing:
+            return existing
+        job = DownloadJob(item, priority)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._push(job)
+        self.notify(job)
+        with self._lock:
+            self._dispatch()
+        return job
+
+    def claim_path(self, job, filepath):
+        # Две задачи с одним файлом делили бы .part и затирали сегменты друг друга
+        with self._lock:
+            for other in self.jobs.values():
+                if other is not job and other.filepath == filepath \
+                        and other.state not in (DownloadJob.DONE, DownloadJob.CANCELLED):
+                    raise IOError(f"{os.path.basename(filepath)} уже скачивается другой задачей")
+            job.filepath = filepath
+
+    def _push(self, job):
+        job.state = DownloadJob.QUEUED
+        job._entry = (-job.priority, next(self._seq), job.id)
+        heapq.heappush(self._pending, job._entry)
+
+    def _dispatch(self):
+        while self._pending and len(self._running) < self.max_parallel:
+            entry = heapq.heappop(self._pending)
+            job = self.jobs.get(entry[2])
+            # Устаревшие записи (после смены приоритета, паузы, отмены) пропускаются
+            if job is None or job._entry != entry or job.state != DownloadJob.QUEUED:
+                continue
+            job.state = DownloadJob.RUNNING
+            self._running.add(job.id)
+            thread = threading.Thread(target=self._run, args=(job,))
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, job):
+        self.notify(job)
+        try:
+            self.run_job(job)
+            job.state = DownloadJob.DONE
+        except DownloadCancelled:
+            job.state = DownloadJob.PAUSED if job._stop == 'pause' else DownloadJob.CANCELLED
+        except Exception as e:
+            job.state = DownloadJob.FAILED
+            job.error = str(e)
+        if job.state == DownloadJob.CANCELLED:
+            self._discard_partial(job)
+        with self._lock:
+            job._stop = None
+            self._running.discard(job.id)
+            self._dispatch()
+        self.notify(job)
+
+    def _discard_partial(self, job):
+        if not job.filepath:
+            return
+        for path in (job.filepath + ".part", job.filepath + ".part.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def pause(self, job_id):
+        job = self.jobs[job_id]
+        with self._lock:
+            if job.state == DownloadJob.RUNNING:
+                job._stop = 'pause'
+            elif job.state == DownloadJob.QUEUED:
+                job.state = DownloadJob.PAUSED
+        self.notify(job)
+
+    def resume(self, job_id):
+        job = self.jobs[job_id]
+        with self._lock:
+            if job.state in (DownloadJob.PAUSED, DownloadJob.FAILED):
+                job.error = None
+                self._push(job)
+                self._dispatch()
+        self.notify(job)
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        with self._lock:
+            if job.state == DownloadJob.RUNNING:
+                job._stop = 'cancel'
+                return
+            if job.state in (DownloadJob.QUEUED, DownloadJob.PAUSED, DownloadJob.FAILED):
+                job.state = DownloadJob.CANCELLED
+        self._discard_partial(job)
+        self.notify(job)
+
+    def set_priority(self, job_id, priority):
+        job = self.jobs[job_id]
+        with self._lock:
+            job.priority = priority
+            if job.state == DownloadJob.QUEUED:
+                self._push(job)
+        self.notify(job)
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job and job.state in (DownloadJob.DONE, DownloadJob.CANCELLED):
+                del self.jobs[job_id]
+
+# --- Формат AppImage ---
+def read_elf_sections(path):
+    # Таблица секций ELF: {имя: (смещение, размер)} и конец ELF-части
+    # (с него в AppImage type 2 начинается SquashFS)
+    with open(path, 'rb') as f:
+        ident = f.read(64)
+        if len(ident) < 52 or ident[:4] != b'\x7fELF':
+            raise ValueError(f"{path}: не ELF-файл")
+        endian = '<' if ident[5] == 1 else '>'
+        if ident[4] == 2:
+            shoff, = struct.unpack_from(endian + 'Q', ident, 0x28)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', ident, 0x3A)
+            sh_format = endian + 'IIQQQQ'
+        else:
+            shoff, = struct.unpack_from(endian + 'I', ident, 0x20)
+            shentsize, shnum, shstrndx = struct.unpack_from(endian + 'HHH', ident, 0x2E)
+            sh_format = endian + 'IIIIII'
+        f.seek(shoff)
+        table = f.read(shentsize * shnum)
+        headers = [struct.unpack_from(sh_format, table, i * shentsize) for i in range(shnum)]
+        sections = {}
+        if shstrndx < len(headers):
+            _, _, _, _, str_offset, str_size = headers[shstrndx]
+            f.seek(str_offset)
+            names = f.read(str_size)
+            for name_offset, _, _, _, offset, size in headers:
+                name = names[name_offset:names.find(b'\0', name_offset)].decode('ascii', 'replace')
+                sections[name] = (offset, size)
+    return sections, shoff + shentsize * shnum
+
+def read_update_info(path):
+    # Строка обновления из секции .upd_info: "zsync|<url>" или "gh-releases-zsync|user|repo|tag|шаблон"
+    sections, _ = read_elf_sections(path)
+    if '.upd_info' not in sections:
+        return ''
+    offset, size = sections['.upd_info']
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size).split(b'\0', 1)[0].decode('utf-8', 'replace').strip()
+
+def resolve_update_info(update_info, session=None, max_wait=0):
+    parts = update_info.split('|')
+    if parts[0] == 'zsync' and len(parts) >= 2:
+        return parts[1]
+    if parts[0] == 'gh-releases-zsync' and len(parts) >= 5:
+        user, repo, tag, pattern = parts[1:5]
+        release_path = 'latest' if tag == 'latest' else f"tags/{quote(tag)}"
+        api_url = f"{GITHUB_API}/repos/{user}/{repo}/releases/{release_path}"
+        status, release = get_http_cache().get_json(api_url, TTL_GITHUB_RELEASE, session, max_wait)
+        if status == 200:
+            for asset in release.get('assets', []):
+                if fnmatch.fnmatch(asset.get('name', ''), pattern):
+                    return asset.get('browser_download_url')
+    return None
+
+# --- Чтение содержимого AppImage без распаковки ---
+SQUASHFS_MAGIC = 0x73717368
+SQUASHFS_COMPRESSORS = {1: 'gzip', 2: 'lzma', 3: 'lzo', 4: 'xz', 5: 'lz4', 6: 'zstd'}
+SQUASHFS_NO_FRAGMENT = 0xffffffff
+SQUASHFS_DIR_TYPES = (1, 8)
+SQUASHFS_FILE_TYPES = (2, 9)
+SQUASHFS_SYMLINK_TYPES = (3, 10)
+INSPECT_MAX_FILE = 16 * 1024 * 1024
+
+def _squashfs_decompressor(compressor):
+    name = SQUASHFS_COMPRESSORS.get(compressor, str(compressor))
+    if name == 'gzip':
+        return zlib.decompress
+    if name in ('xz', 'lzma'):
+        return lambda data: lzma.decompress(data)
+    if name == 'zstd':
+        try:
+            import zstandard
+            return lambda data: zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 20)
+        except ImportError:
+            try:
+                from compression import zstd
+                return zstd.decompress
+            except ImportError:
+                pass
+    raise ValueError(f"Сжатие SquashFS '{name}' не поддерживается (для zstd нужен модуль zstandard)")
+
+class AppImageInspector:
+    # Читает файлы из встроенной SquashFS прямо из mmap образа: находит начало
+    # файловой системы по концу ELF-заголовков и разбирает только нужные
+    # метаданные и блоки. Образ не монтируется и не читается целиком.
+    def __init__(self, path):
+        self.path = path
+        _, self.fs_offset = read_elf_sections(path)
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            self._file.close()
+            raise
+        self._metadata_cache = {}
+        try:
+            (magic, self.inode_count, _, self.block_size, _, compressor, _, _, _, major, _,
+             self.root_inode, _, _, _, self.inode_table, self.directory_table,
+             self.fragment_table, _) = struct.unpack_from('<IIIIIHHHHHHQQQQQQQQ', self._map, self.fs_offset)
+            if magic != SQUASHFS_MAGIC or major != 4:
+                raise ValueError(f"{path}: не найдена SquashFS 4.x (AppImage type 2)")
+            self._decompress = _squashfs_decompressor(compressor)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _metadata_block(self, position):
+        # Блок метаданных по абсолютной позиции в SquashFS: (данные, позиция следующего блока)
+        block = self._metadata_cache.get(position)
+        if block is None:
+            start = self.fs_offset + position
+            header, = struct.unpack_from('<H', self._map, start)
+            size = header & 0x7fff
+            data = self._map[start + 2:start + 2 + size]
+            if not header & 0x8000:
+                data = self._decompress(data)
+            block = (data, position + 2 + size)
+            self._metadata_cache[position] = block
+        return block
+
+    def _read_metadata(self, position, offset, length):
+        out = bytearray()
+        while len(out) < length:
+            data, next_position = self._metadata_block(position)
+            out += data[offset:offset + length - len(out)]
+            position, offset = next_position, 0
+        return bytes(out)
+
+    def _inode(self, ref):
+        position = self.inode_table + (ref >> 16)
+        offset = ref & 0xffff
+        inode_type, = struct.unpack('<H', self._read_metadata(position, offset, 2))
+        body = offset + 16
+        if inode_type == 1:
+            start, _, size, block_offset, _ = struct.unpack('<IIHHI', self._read_metadata(position, body, 16))
+            return {'type': inode_type, 'dir_start': start, 'dir_offset': block_offset, 'size': size}
+        if inode_type == 8:
+            _, size, start, _, _, block_offset, _ = struct.unpack('<IIIIHHI', self._read_metadata(position, body, 24))
+            return {'type': inode_type, 'dir_start': start, 'dir_offset': block_offset, 'size': size}
+        if inode_type in SQUASHFS_FILE_TYPES:
+            if inode_type == 2:
+                blocks_start, fragment, frag_offset, size = struct.unpack('<IIII', self._read_metadata(position, body, 16))
+                sizes_at = body + 16
+            else:
+                blocks_start, size, _, _, fragment, frag_offset, _ = struct.unpack(
+                    '<QQQIIII', self._read_metadata(position, body, 40))
+                sizes_at = body + 40
+            count = size // self.block_size if fragment != SQUASHFS_NO_FRAGMENT else -(-size // self.block_size)
+            sizes = struct.unpack(f'<{count}I', self._read_metadata(position, sizes_at, 4 * count))
+            return {'type': inode_type, 'blocks_start': blocks_start, 'fragment': fragment,
+                    'frag_offset': frag_offset, 'size': size, 'block_sizes': sizes}
+        if inode_type in SQUASHFS_SYMLINK_TYPES:
+            _, target_size = struct.unpack('<II', self._read_metadata(position, body, 8))
+            target = self._read_metadata(position, body + 8, target_size)
+            return {'type': inode_type, 'target': target.decode('utf-8', 'replace')}
+        return {'type': inode_type}
+
+    def listdir(self, inode):
+        # {имя: ссылка на inode} для inode каталога
+        entries = {}
+        remaining = inode['size'] - 3
+        position = self.directory_table + inode['dir_start']
+        data = self._read_metadata(position, inode['dir_offset'], max(remaining, 0))
+        pos = 0
+        while pos + 12 <= len(data):
+            count, start, _ = struct.unpack_from('<III', data, pos)
+            pos += 12
+            for _ in range(count + 1):
+                offset, _, _, name_size = struct.unpack_from('<HhHH', data, pos)
+                pos += 8
+                name = data[pos:pos + name_size + 1].decode('utf-8', 'replace')
+                pos += name_size + 1
+                entries[name] = (start << 16) | offset
+        return entries
+
+    def lookup(self, path, follow_symlinks=True, _depth=0):
+        if _depth > 16:
+            raise OSError(f"Слишком много символических ссылок: {path}")
+        inode = self._inode(self.root_inode)
+        parts = [p for p in path.split('/') if p and p != '.']
+        walked = []
+        for i, part in enumerate(parts):
+            if part == '..':
+                walked = walked[:-1]
+                inode = self.lookup('/'.join(walked), True, _depth + 1)
+                continue
+            if inode['type'] not in SQUASHFS_DIR_TYPES:
+                raise FileNotFoundError(path)
+            entries = self.listdir(inode)
+            if part not in entries:
+                raise FileNotFoundError(path)
+            inode = self._inode(entries[part])
+            last = i == len(parts) - 1
+            if inode['type'] in SQUASHFS_SYMLINK_TYPES and (follow_symlinks or not last):
+                target = inode['target']
+                base = [] if target.startswith('/') else walked
+                inode = self.lookup('/'.join(base + [target] + parts[i + 1:]), follow_symlinks, _depth + 1)
+                return inode
+            walked.append(part)
+        return inode
+
+    def _fragment(self, index):
+        pointer_at = self.fs_offset + self.fragment_table + (index // 512) * 8
+        block_position, = struct.unpack_from('<Q', self._map, pointer_at)
+        start, size, _ = struct.unpack('<QII', self._read_metadata(block_position, (index % 512) * 16, 16))
+        return self._data_block(start, size)
+
+    def _data_block(self, start, size_word):
+        size = size_word & 0xffffff
+        if size == 0:
+            return bytes(self.block_size)
+        data = self._map[self.fs_offset + start:self.fs_offset + start + size]
+        return data if size_word & 0x1000000 else self._decompress(data)
+
+    def read_file(self, path, max_size=INSPECT_MAX_FILE):
+        inode = self.lookup(path)
+        if inode['type'] not in SQUASHFS_FILE_TYPES:
+            raise IsADirectoryError(path)
+        if inode['size'] > max_size:
+            raise ValueError(f"{path}: файл слишком большой ({inode['size']} байт)")
+        out = bytearray()
+        position = inode['blocks_start']
+        for size_word in inode['block_sizes']:
+            out += self._data_block(position, size_word)
+            position += size_word & 0xffffff
+        if inode['fragment'] != SQUASHFS_NO_FRAGMENT:
+            tail = inode['size'] % self.block_size
+            out += self._fragment(inode['fragment'])[inode['frag_offset']:inode['frag_offset'] + tail]
+        return bytes(out[:inode['size']])
+
+    def root_entries(self):
+        return self.listdir(self._inode(self.root_inode))
+
+    def desktop_entry(self):
+        # Ключи группы [Desktop Entry] из .desktop в корне образа
+        for name in self.root_entries():
+            if name.endswith('.desktop'):
+                return parse_desktop_entry(self.read_file(name).decode('utf-8', 'replace'))
+        return {}
+
+    def icon(self):
+        # (данные, расширение) иконки из .DirIcon или None
+        try:
+            data = self.read_file('.DirIcon')
+        except (OSError, ValueError):
+            return None
+        if data.startswith(b'\x89PNG'):
+            return data, 'png'
+        if b'<svg' in data[:4096]:
+            return data, 'svg'
+        return None
+
+    def appstream(self):
+        for directory in ('usr/share/metainfo', 'usr/share/appdata'):
+            try:
+                entries = self.listdir(self.lookup(directory))
+            except (OSError, KeyError):
+                continue
+            for name in sorted(entries):
+                if name.endswith('.xml'):
+                    return self.read_file(f"{directory}/{name}")
+        return None
+
+    def metadata(self):
+        # Сведения о приложении из самого образа: .desktop + AppStream
+        desktop = self.desktop_entry()
+        info = {
+            'name': desktop.get('Name', ''),
+            'comment': desktop.get('Comment', ''),
+            'categories': desktop.get('Categories', ''),
+            'exec': desktop.get('Exec', ''),
+            'icon_name': desktop.get('Icon', ''),
+            'version': desktop.get('X-AppImage-Version', ''),
+        }
+        xml_data = self.appstream()
+        if xml_data:
+            try:
+                root = ElementTree.fromstring(xml_data)
+                info['name'] = info['name'] or (root.findtext('name') or '').strip()
+                info['comment'] = info['comment'] or (root.findtext('summary') or '').strip()
+                release = root.find('releases/release')
+                if release is not None and not info['version']:
+                    info['version'] = release.get('version', '')
+            except ElementTree.ParseError:
+                pass
+        return info
+
+def parse_desktop_entry(text):
+    entry = {}
+    in_group = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_group = line == '[Desktop Entry]'
+        elif in_group and '=' in line and not line.startswith('#'):
+            key, _, value = line.partition('=')
+            entry.setdefault(key.strip(), value.strip())
+    return entry
+
+def inspect_appimage(path):
+    # Метаданные и иконка из образа; None, если образ не удалось разобрать
+    try:
+        with AppImageInspector(path) as inspector:
+            return inspector.metadata(), inspector.icon()
+    except (OSError, ValueError, struct.error, zlib.error, lzma.LZMAError) as e:
+        get_tracer().error('appimage.inspect', e)
+        return None, None
+
+# --- Дельта-обновления (zsync) ---
+def native_md4():
+    # MD4 из OpenSSL, если он не отключён (в OpenSSL 3 обычно отключён); None — проверять нечем
+    try:
+        hashlib.new('md4')
+        return lambda data: hashlib.new('md4', data).digest()
+    except ValueError:
+        return None
+
+def rsum(block):
+    # Слабая контрольная сумма zsync (16-битные a и b), b = Σ(len - i)·c_i = Σ префиксных сумм
+    return sum(block) & 0xffff, sum(itertools.accumulate(block)) & 0xffff
+
+def find_zsync_tool():
+    for name in ZSYNC_TOOLS:
+        path = shutil.which(name)
+        if path:
+            return name, path
+    return None
+
+class ZsyncControl:
+    # Разобранный .zsync: заголовок и контрольные суммы блоков целевого файла.
+    # Слабая сумма блока хранится одним числом ((a & a_mask) << 16) | b, пары сумм
+    # соседних блоков — в pair_table для поиска цепочек
+    def __init__(self, data, base_url):
+        head, _, body = data.partition(b'\n\n')
+        header = {}
+        for line in head.decode('utf-8', 'replace').splitlines():
+            key, _, value = line.partition(':')
+            header.setdefault(key.strip(), value.strip())
+        self.blocksize = int(header['Blocksize'])
+        self.length = int(header['Length'])
+        self.filename = os.path.basename(header.get('Filename', ''))
+        self.sha1 = header.get('SHA-1', '').lower()
+        self.url = urljoin(base_url, header['URL'])
+        seq_matches, rsum_bytes, checksum_bytes = (int(v) for v in header.get('Hash-Lengths', '1,4,16').split(','))
+        self.checksum_bytes = checksum_bytes
+        self.a_mask = 0 if rsum_bytes < 3 else (0xff if rsum_bytes == 3 else 0xffff)
+        self.block_count = -(-self.length // self.blocksize)
+        self.checksums = []
+        self.block_keys = []
+        entry = rsum_bytes + checksum_bytes
+        for idx in range(self.block_count):
+            raw = body[idx * entry:(idx + 1) * entry]
+            if len(raw) < entry:
+                raise ValueError("Обрезанный .zsync файл")
+            a, b = struct.unpack('>HH', b'\0' * (4 - rsum_bytes) + raw[:rsum_bytes])
+            self.block_keys.append(((a & self.a_mask) << 16) | b)
+            self.checksums.append(raw[rsum_bytes:])
+        self.pair_table = {}
+        for idx in range(self.block_count - 1):
+            self.pair_table.setdefault(self.pair_key(self.block_keys[idx], self.block_keys[idx + 1]), []).append(idx)
+
+    @staticmethod
+    def pair_key(first, second):
+        return (first << 32) | second
+
+    def window_key(self, block):
+        a, b = rsum(block)
+        return ((a & self.a_mask) << 16) | b
+
+    def block_range(self, idx):
+        start = idx * self.blocksize
+        return start, min(start + self.blocksize, self.length)
+
+def fetch_zsync_control(zsync_url, session=None):
+    session = session or get_http_session()
+    response = session.get(zsync_url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return ZsyncControl(response.content, response.url or zsync_url)
+
+def _window_keys(data, bs, a_mask):
+    # Слабые суммы всех окон длины bs в data разом: a и b через префиксные суммы
+    # (b окна = Q[i+bs] - Q[i] - bs·P[i], где P — префиксные суммы байтов, Q — сумм P).
+    # Нужны только 16 младших бит, поэтому в numpy хватает переполняющегося uint32
+    numpy = load_numpy()
+    if numpy is not None:
+        d = numpy.frombuffer(data, dtype=numpy.uint8)
+        p = numpy.zeros(len(d) + 1, dtype=numpy.uint32)
+        numpy.cumsum(d, out=p[1:], dtype=numpy.uint32)
+        q = numpy.zeros_like(p)
+        numpy.cumsum(p[1:], out=q[1:], dtype=numpy.uint32)
+        a = p[bs:] - p[:-bs]
+        b = q[bs:] - q[:-bs] - numpy.uint32(bs) * p[:-bs]
+        return ((a & numpy.uint32(a_mask)) << numpy.uint32(16)) | (b & numpy.uint32(0xffff))
+    p = list(itertools.accumulate(data, initial=0))
+    q = list(itertools.accumulate(p[1:], initial=0))
+    a = map(operator.and_, map(operator.sub, p[bs:], p), itertools.repeat(a_mask))
+    b = map(operator.sub, map(operator.sub, q[bs:], q), map(operator.mul, p, itertools.repeat(bs)))
+    return list(map(operator.or_, map(operator.lshift, a, itertools.repeat(16)),
+                    map(operator.and_, b, itertools.repeat(0xffff))))
+
+def _block_keys(data, bs, a_mask):
+    # Слабые суммы подряд идущих целых блоков data (numpy)
+    numpy = load_numpy()
+    d = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, bs).astype(numpy.uint32)
+    a = d.sum(axis=1, dtype=numpy.uint32)
+    b = (d * numpy.arange(bs, 0, -1, dtype=numpy.uint32)).sum(axis=1, dtype=numpy.uint32)
+    return (((a & numpy.uint32(a_mask)) << numpy.uint32(16)) | (b & numpy.uint32(0xffff))).tolist()
+
+def _pair_hash(numpy, first, second):
+    # 24-битный хеш пары сумм для битовой маски-фильтра
+    return ((first * numpy.uint32(0x9e3779b1)) ^ second) & numpy.uint32(0xffffff)
+
+def _pair_filter(control):
+    # Фильтр по хешу пар сумм соседних блоков (numpy) или None: в ячейке — сколько разных
+    # ещё не найденных пар с таким хешем, чтобы найденные пары можно было из него убирать
+    numpy = load_numpy()
+    if numpy is None:
+        return None
+    known = numpy.zeros(1 << 24, dtype=numpy.uint16)
+    pairs = numpy.array(list(control.pair_table), dtype=numpy.uint64)
+    hashes = _pair_hash(numpy, (pairs >> numpy.uint64(32)).astype(numpy.uint32),
+                        (pairs & numpy.uint64(0xffffffff)).astype(numpy.uint32))
+    numpy.add.at(known, hashes, 1)
+    return known
+
+def _chain_candidates(m, size, control, table, first, known, is_cancelled):
+    # Позиции от first, где слабые суммы окна и окна через блок совпадают с парой соседних
+    # блоков целевого файла, ещё не найденной (table). Файл обрабатывается кусками:
+    # в numpy по ZSYNC_SCAN_CHUNK, пары сначала отсеиваются фильтром known, точная проверка —
+    # по table; без numpy куски мельче — кандидат обычно находится в пределах блока
+    # от изменения. Хвост файла, как и в zsync, дополняется нулями.
+    # Из позиций с одинаковыми суммами всей цепочки (нули, повторы) в куске отдаётся только
+    # первая: её проверка решает и за остальные, иначе повторы проверялись бы на каждом байте
+    bs = control.blocksize
+    span = ZSYNC_CHAIN * bs
+    numpy = load_numpy()
+    chunk = ZSYNC_SCAN_CHUNK if known is not None else ZSYNC_SCAN_CHUNK // 16
+    for start in range(first, size, chunk):
+        if is_cancelled():
+            raise DownloadCancelled()
+        end = min(start + chunk, size)
+        window = m[start:end + span - 1]
+        keys = _window_keys(window + bytes(end - start + span - 1 - len(window)), bs, control.a_mask)
+        # Цепочки у конца файла короче и не сравнимы с остальными — они не схлопываются
+        tail = max(0, size - span + 1 - start)
+        if known is not None:
+            n = end - start
+            offsets = numpy.flatnonzero(known[_pair_hash(numpy, keys[:n], keys[bs:bs + n])])
+            chains = numpy.stack([keys[offsets + j * bs] for j in range(ZSYNC_CHAIN)], axis=1)
+            inner = offsets < tail
+            _, first_seen = numpy.unique(chains[inner], axis=0, return_index=True)
+            offsets = numpy.sort(numpy.concatenate([offsets[inner][first_seen], offsets[~inner]]))
+            for offset in offsets.tolist():
+                if control.pair_key(int(keys[offset]), int(keys[offset + bs])) in table:
+                    yield start + offset
+        else:
+            pair_keys = map(control.pair_key, keys, keys[bs:end - start + bs])
+            seen = set()
+            for offset in itertools.compress(itertools.count(), map(table.__contains__, pair_keys)):
+                if offset < tail:
+                    chain = tuple(keys[offset:offset + span:bs])
+                    if chain in seen:
+                        continue
+                    seen.add(chain)
+                yield start + offset
+
+def match_local_blocks(path, control, is_cancelled=None):
+    # Ищет блоки целевого файла в локальной версии. Сразу за совпавшим блоком проверяется
+    # следующий (в неизменённых участках блоки идут подряд), иначе позиции-кандидаты
+    # ищутся векторно по целым кускам файла. Блок засчитывается, если слабые суммы совпали
+    # у ZSYNC_CHAIN блоков подряд (как seq_matches в zsync); MD4 дополнительно проверяется,
+    # только если он есть в OpenSSL. Ошибку сопоставления ловит SHA-1 всего файла,
+    # после чего файл скачивается целиком. Возвращает {блок: смещение в локальном файле}.
+    is_cancelled = is_cancelled or (lambda: False)
+    bs = control.blocksize
+    count = control.block_count
+    md4 = native_md4()
+    found = {}
+    # Ещё не найденные блоки по паре сумм: найденные убираются, иначе повторяющиеся
+    # блоки (нули, выравнивание) перебирались бы заново на каждой позиции
+    table = {key: set(indices) for key, indices in control.pair_table.items()}
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return found
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            keys = {}
+            batch = 256 if load_numpy() is not None else 1
+
+            def key_at(pos):
+                # С numpy суммы внутри серии совпадений считаются сразу для batch блоков вперёд:
+                # в неизменённых участках они понадобятся следующими; у нового кандидата — только
+                # для его цепочки. За концом файла — нули, как и у последнего блока целевого
+                # файла в .zsync
+                if pos not in keys:
+                    ahead = batch if pos == 0 or pos - bs in keys else min(batch, ZSYNC_CHAIN)
+                    whole = min(ahead, (size - pos) // bs)
+                    if whole > 1:
+                        for n, key in enumerate(_block_keys(m[pos:pos + whole * bs], bs, control.a_mask)):
+                            keys[pos + n * bs] = key
+                    else:
+                        block = m[pos:pos + bs]
+                        keys[pos] = control.window_key(block + bytes(bs - len(block)))
+                return keys[pos]
+
+            def take(idx, i):
+                found[idx] = i
+                if idx < count - 1:
+                    pair = control.pair_key(control.block_keys[idx], control.block_keys[idx + 1])
+                    table[pair].discard(idx)
+                    if not table[pair]:
+                        del table[pair]
+                        if known is not None:
+                            numpy = load_numpy()
+                            pair_keys = numpy.array(control.block_keys[idx:idx + 2], dtype=numpy.uint32)
+                            known[_pair_hash(numpy, pair_keys[:1], pair_keys[1:])] -= 1
+
+            def match_at(i):
+                first = key_at(i)
+                candidates = list(table.get(control.pair_key(first, key_at(i + bs)), ()))
+                # Последний блок не с чем сцепить впереди — он должен продолжать совпавший предыдущий
+                if (count - 1 not in found and control.block_keys[count - 1] == first
+                        and (count == 1 or found.get(count - 2) == i - bs)):
+                    candidates.append(count - 1)
+                matched = []
+                for idx in candidates:
+                    start, end = control.block_range(idx)
+                    if i + end - start > size:
+                        continue
+                    chain = range(2, min(ZSYNC_CHAIN, count - idx))
+                    if any(i + n * bs >= size or key_at(i + n * bs) != control.block_keys[idx + n] for n in chain):
+                        continue
+                    if md4 and md4(m[i:i + bs].ljust(bs, b'\0'))[:control.checksum_bytes] != control.checksums[idx]:
+                        continue
+                    take(idx, i)
+                    matched.append(idx)
+                return matched
+
+            known = _pair_filter(control)
+            candidates = None
+            i = 0
+            while len(found) < count and i < size:
+                if match_at(i):
+                    i += bs
+                    candidates = None
+                    if not (i // bs) & 0xff and is_cancelled():
+                        raise DownloadCancelled()
+                    continue
+                # После серии совпадений поиск кандидатов начинается заново с текущей позиции;
+                # позиции, все блоки которых уже найдены, генератор пропускает не пересчитывая
+                if candidates is None:
+                    candidates = _chain_candidates(m, size, control, table, i + 1, known, is_cancelled)
+                following = next((pos for pos in candidates if pos > i), None)
+                if following is None:
+                    break
+                i = following
+    return found
+
+def _missing_ranges(control, found, merge_gap=16):
+    # Недостающие блоки склеиваются в диапазоны; маленькие просветы между ними
+    # тоже докачиваются, чтобы не плодить запросы
+    ranges = []
+    for idx in range(control.block_count):
+        if idx in found:
+            continue
+        if ranges and idx - ranges[-1][1] <= merge_gap:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+    return [(control.block_range(first)[0], control.block_range(last - 1)[1]) for first, last in ranges]
+
+class DeltaUpdater:
+    # Обновление установленного AppImage по встроенной информации об обновлении:
+    # блоки, которые уже есть в локальной версии, копируются из неё,
+    # по сети докачиваются только изменённые диапазоны.
+    def __init__(self, appimage_path, session=None, progress_callback=None, is_cancelled=None, throttle=None):
+        self.appimage_path = appimage_path
+        self.session = session or get_http_session()
+        self.progress_callback = progress_callback or (lambda done, total: None)
+        self.is_cancelled = is_cancelled or (lambda: False)
+        self.throttle = throttle or (lambda nbytes: None)
+        self.control = None
+        self.zsync_url = None
+        # Имя внешней программы, если обновление сделала она (тогда байты не подсчитываются)
+        self.tool = None
+        self.reused_bytes = 0
+        self.downloaded_bytes = 0
+
+    def check(self):
+        # Возвращает ZsyncControl новой версии или None, если обновление не нужно/невозможно
+        update_info = read_update_info(self.appimage_path)
+        if not update_info:
+            return None
+        zsync_url = resolve_update_info(update_info, self.session)
+        if not zsync_url:
+            return None
+        control = fetch_zsync_control(zsync_url, self.session)
+        self.zsync_url = zsync_url
+        records = get_verification_records()
+        digests = records.lookup(self.appimage_path) or {}
+        if 'sha1' not in digests:
+            digests = hash_file(self.appimage_path, ('sha1',))
+            records.record(self.appimage_path, digests)
+        if control.sha1 and control.sha1 == digests['sha1']:
+            return None
+        self.control = control
+        return control
+
+    def run(self):
+        control = self.control or self.check()
+        if control is None:
+            return None
+        target_dir = os.path.dirname(self.appimage_path)
+        target_path = os.path.join(target_dir, control.filename or os.path.basename(self.appimage_path))
+        part_path = target_path + ".part"
+
+        tool = find_zsync_tool()
+        if tool:
+            self._run_tool(tool, control, part_path)
+        else:
+            self._assemble(control, part_path)
+
+        digests = hash_file(part_path, ('sha1',))
+        try:
+            check_digests(digests, {'sha1': control.sha1} if control.sha1 else {})
+        except IntegrityError:
+            os.remove(part_path)
+            raise
+        os.chmod(part_path, os.stat(self.appimage_path).st_mode & 0o7777 or 0o755)
+        os.replace(part_path, target_path)
+        if target_path != self.appimage_path:
+            os.remove(self.appimage_path)
+        get_verification_records().record(target_path, digests)
+        return target_path
+
+    def _run_tool(self, tool, control, part_path):
+        # zsync/zsync2 собирают файл по .zsync из локальной версии (-i) в part_path;
+        # appimageupdatetool обновляет копию образа на месте (-O). Отмена завершает процесс
+        name, path = tool
+        if name == 'appimageupdatetool':
+            shutil.copy2(self.appimage_path, part_path)
+            command = [path, '-O', part_path]
+        else:
+            command = [path, '-q', '-i', self.appimage_path, '-o', part_path, self.zsync_url]
+        self.tool = name
+        self.progress_callback(0, control.length)
+        # stderr — во временный файл: предупреждения сверх буфера канала остановили бы процесс,
+        # пока его никто не читает
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, cwd=os.path.dirname(part_path),
+                                       stdout=subprocess.DEVNULL, stderr=stderr)
+            try:
+                while process.poll() is None:
+                    if self.is_cancelled():
+                        process.terminate()
+                        process.wait()
+                        raise DownloadCancelled()
+                    time.sleep(0.2)
+                if process.returncode != 0:
+                    stderr.seek(max(0, os.fstat(stderr.fileno()).st_size - 4096))
+                    error = stderr.read().decode('utf-8', 'replace').strip().splitlines()
+                    raise IOError(f"{name} завершился с кодом {process.returncode}: {error[-1] if error else ''}")
+            except BaseException:
+                for leftover in (part_path, f"{part_path}.part", f"{part_path}.zs-old"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+                raise
+        if os.path.exists(f"{part_path}.zs-old"):
+            os.remove(f"{part_path}.zs-old")
+        self.progress_callback(control.length, control.length)
+
+    def _assemble(self, control, part_path):
+        found = match_local_blocks(self.appimage_path, control, self.is_cancelled)
+        missing = _missing_ranges(control, found)
+        need = sum(end - start for start, end in missing)
+        done = 0
+        with open(part_path, 'wb') as f:
+            f.truncate(control.length)
+        fd_out = os.open(part_path, os.O_RDWR)
+        fd_in = os.open(self.appimage_path, os.O_RDONLY)
+        try:
+            for idx, local_offset in found.items():
+                start, end = control.block_range(idx)
+                os.pwrite(fd_out, os.pread(fd_in, end - start, local_offset), start)
+                self.reused_bytes += end - start
+            buffer = bytearray(DOWNLOAD_BUFFER_SIZE)
+            for start, end in missing:
+                if self.is_cancelled():
+                    raise DownloadCancelled()
+                response = self.session.get(control.url, headers={'Range': f"bytes={start}-{end - 1}"},
+                                            stream=True, timeout=DOWNLOAD_TIMEOUT)
+                with response:
+                    if response.status_code != 206:
+                        raise requests.HTTPError(f"Сервер вернул {response.status_code} на запрос диапазона")
+                    offset = start
+                    for chunk in iter_response_into(response, buffer):
+                        chunk = chunk[:end - offset]
+                        self.throttle(len(chunk))
+                        os.pwrite(fd_out, chunk, offset)
+                        offset += len(chunk)
+                        done += len(chunk)
+                        self.progress_callback(done, need)
+                        if offset >= end:
+                            break
+                if offset < end:
+                    raise IOError(f"Диапазон {start}-{end - 1} получен не полностью")
+                self.downloaded_bytes += end - start
+        except BaseException:
+            os.close(fd_out)
+            os.close(fd_in)
+            os.remove(part_path)
+            raise
+        os.close(fd_out)
+        os.close(fd_in)
+
+def update_appimage(appimage_path, session=None, progress_callback=None, is_cancelled=None, throttle=None):
+    with get_tracer().span('zsync.update', path=appimage_path) as span:
+        new_path, updater = _update_appimage(appimage_path, session, progress_callback, is_cancelled, throttle)
+        span.set(updated=new_path is not None, reused_bytes=updater.reused_bytes,
+                 downloaded_bytes=updater.downloaded_bytes, tool=updater.tool or '')
+    return new_path, updater
+
+def _update_appimage(appimage_path, session, progress_callback, is_cancelled, throttle):
+    # Дельта-обновление; если сборка из блоков не сошлась по SHA-1 — полная загрузка новой версии
+    updater = DeltaUpdater(appimage_path, session, progress_callback, is_cancelled, throttle)
+    control = updater.check()
+    if control is None:
+        return None, updater
+    try:
+        return updater.run(), updater
+    except IntegrityError:
+        target_path = os.path.join(os.path.dirname(appimage_path), control.filename or os.path.basename(appimage_path))
+        downloader = SegmentedDownloader(control.url, target_path, session=session,
+                                         progress_callback=progress_callback, is_cancelled=is_cancelled,
+                                         throttle=throttle, expected_digests={'sha1': control.sha1})
+        downloader.run()
+        os.chmod(target_path, 0o755)
+        if target_path != appimage_path:
+            os.remove(appimage_path)
+        get_verification_records().record(target_path, downloader.digests)
+        updater.downloaded_bytes = control.length
+        return target_path, updater
+
+def retarget_desktop_entries(old_path, new_path):
+    # После обновления с новым именем файла ярлыки должны запускать новую версию
+    applications_dir = DESKTOP_ENTRY_DIR
+    try:
+        names = os.listdir(applications_dir)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith('.desktop'):
+            continue
+        path = os.path.join(applications_dir, name)
+        try:
+            with open(path, 'r') as f:
+                content = f.read()
+        except OSError:
+            continue
+        if f"Exec={old_path}" in content:
+            with open(path, 'w') as f:
+                f.write(content.replace(f"Exec={old_path}", f"Exec={new_path}"))
+
+# --- Иконки и кэши рабочего стола ---
+class IconStore:
+    # Иконки хранятся по хэшу содержимого: одинаковые иконки разных приложений
+    # лежат один раз, имена не конфликтуют. Растровые иконки приводятся к квадрату
+    # и раскладываются по размерам hicolor, SVG кладётся в scalable как есть.
+    # Файл, не упомянутый ни в одной записи инвентаря, удаляется при очистке.
+    def __init__(self, theme_dir=ICON_THEME_DIR, sizes=ICON_STORE_SIZES):
+        self.theme_dir = theme_dir
+        self.sizes = sizes
+        self._lock = threading.Lock()
+
+    def _dirs(self):
+        return [os.path.join(self.theme_dir, f"{size}x{size}", "apps") for size in self.sizes] + \
+               [os.path.join(self.theme_dir, "scalable", "apps")]
+
+    def _existing(self, name):
+        files = []
+        for directory in self._dirs():
+            for ext in ('png', 'svg'):
+                path = os.path.join(directory, f"{name}.{ext}")
+                if os.path.exists(path):
+                    files.append(path)
+        return files
+
+    @staticmethod
+    def _sniff(header):
+        if header.startswith(b'\x89PNG'):
+            return 'png'
+        head = header.lstrip().lower()
+        if head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in header.lower()):
+            return 'svg'
+        return 'raster'
+
+    def add_bytes(self, data):
+        # Иконка из самого образа — уже в памяти, пишется тем же путём, что и загруженная
+        ensure_dir(self.theme_dir)
+        tmp_path = os.path.join(self.theme_dir, f".icon.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return self._install(tmp_path, hashlib.sha256(data).hexdigest(), data[:512])
+
+    def fetch(self, url, session=None):
+        with get_tracer().span('icon.fetch', url=url):
+            return self._fetch(url, session or get_http_session())
+
+    def _fetch(self, url, session):
+        # Иконка пишется на диск потоково, хэш считается по ходу; размер ограничен ICON_MAX_BYTES
+        ensure_dir(self.theme_dir)
+        tmp_path = os.path.join(self.theme_dir, f".icon.{threading.get_ident()}.tmp")
+        hasher = hashlib.sha256()
+        header = b''
+        size = 0
+        with session.get(url, stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > ICON_MAX_BYTES:
+                        f.close()
+                        os.remove(tmp_path)
+                        raise ValueError(f"иконка больше {format_size(ICON_MAX_BYTES)}")
+                    if len(header) < 512:
+                        header += chunk[:512 - len(header)]
+                    hasher.update(chunk)
+                    f.write(chunk)
+        return self._install(tmp_path, hasher.hexdigest(), header)
+
+    def _install(self, tmp_path, digest, header):
+        # Возвращает (имя иконки для Icon=, список файлов)
+        name = f"{ICON_STORE_PREFIX}{digest[:24]}"
+        try:
+            with self._lock:
+                files = self._existing(name)
+                if files:
+                    # Иконка уже есть — только продлеваем ей жизнь для evict_orphans
+                    for path in files:
+                        os.utime(path)
+                    return name, files
+                kind = self._sniff(header)
+                if kind == 'svg':
+                    directory = os.path.join(self.theme_dir, "scalable", "apps")
+                    ensure_dir(directory)
+                    path = os.path.join(directory, f"{name}.svg")
+                    os.replace(tmp_path, path)
+                    return name, [path]
+                return name, self._write_sizes(tmp_path, name)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _write_sizes(self, source_path, name):
+        # Непрозрачные и неквадратные иконки вписываются в прозрачный квадрат;
+        # размеры крупнее исходника не создаются (кроме самого маленького)
+        GdkPixbuf = load_gdk_pixbuf()
+        if GdkPixbuf is None:
+            return self._write_unscaled(source_path, name)
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(source_path)
+        if not pixbuf.get_has_alpha():
+            pixbuf = pixbuf.add_alpha(False, 0, 0, 0)
+        width, height = pixbuf.get_width(), pixbuf.get_height()
+        side = max(width, height)
+        canvas = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, True, 8, side, side)
+        canvas.fill(0)
+        pixbuf.copy_area(0, 0, width, height, canvas, (side - width) // 2, (side - height) // 2)
+        files = []
+        for size in [s for s in self.sizes if s <= side] or [min(self.sizes)]:
+            directory = os.path.join(self.theme_dir, f"{size}x{size}", "apps")
+            ensure_dir(directory)
+            path = os.path.join(directory, f"{name}.png")
+            scaled = canvas if size == side else canvas.scale_simple(size, size, GdkPixbuf.InterpType.HYPER)
+            tmp_path = f"{path}.tmp"
+            scaled.savev(tmp_path, 'png', [], [])
+            os.replace(tmp_path, path)
+            files.append(path)
+        return files
+
+    def _write_unscaled(self, source_path, name):
+        # Без GdkPixbuf: PNG кладётся в ближайший не больший размер hicolor
+        with open(source_path, 'rb') as f:
+            header = f.read(24)
+        if not header.startswith(b'\x89PNG') or len(header) < 24:
+            raise ValueError("для этого формата иконки нужен GdkPixbuf")
+        side = max(struct.unpack('>II', header[16:24]))
+        size = max([s for s in self.sizes if s <= side] or [min(self.sizes)])
+        directory = os.path.join(self.theme_dir, f"{size}x{size}", "apps")
+        ensure_dir(directory)
+        path = os.path.join(directory, f"{name}.png")
+        shutil.copyfile(source_path, path)
+        return [path]
+
+    def evict_orphans(self, referenced):
+        # referenced — имена иконок из инвентаря. Недавно добавленные файлы не трогаем:
+        # их установка могла ещё не попасть в инвентарь
+        cutoff = time.time() - ICON_ORPHAN_GRACE
+        removed = []
+        with self._lock:
+            for directory in self._dirs():
+                try:
+                    with os.scandir(directory) as it:
+                        candidates = [de for de in it if de.name.startswith(ICON_STORE_PREFIX)]
+                    for de in candidates:
+                        name = de.name.rsplit('.', 1)[0]
+                        if name not in referenced and de.stat().st_mtime < cutoff:
+                            os.remove(de.path)
+                            removed.append(de.path)
+                except OSError:
+                    continue
+        return removed
+
+class CacheRefresher:
+    # gtk-update-icon-cache и update-desktop-database сканируют всё дерево целиком,
+    # поэтому запускаются один раз на пачку установок: каждый новый запрос
+    # откладывает запуск на CACHE_REFRESH_DELAY секунд
+    def __init__(self, delay=CACHE_REFRESH_DELAY):
+        self.delay = delay
+        self._icons = False
+        self._desktop = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def schedule(self, icons=False, desktop=False):
+        with self._lock:
+            self._icons |= icons
+            self._desktop |= desktop
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            icons, desktop = self._icons, self._desktop
+            self._icons = self._desktop = False
+        commands = []
+        if icons:
+            commands.append(['gtk-update-icon-cache', '-f', '-t', ICON_THEME_DIR])
+        if desktop:
+            commands.append(['update-desktop-database', DESKTOP_ENTRY_DIR])
+        for command in commands:
+            try:
+                subprocess.run(command, capture_output=True)
+            except OSError:
+                pass
+
+_icon_store = None
+_cache_refresher = None
+
+def get_icon_store():
+    global _icon_store
+    with _http_session_lock:
+        if _icon_store is None:
+            _icon_store = IconStore()
+        return _icon_store
+
+def get_cache_refresher():
+    global _cache_refresher
+    with _http_session_lock:
+        if _cache_refresher is None:
+            _cache_refresher = CacheRefresher()
+        return _cache_refresher
+
+# --- Быстрый запуск из распакованных образов ---
+# Скрипт из Exec ярлыка. mtime скрипта равен mtime образа на момент распаковки:
+# если образ заменили, дерево устарело и запускается сам образ
+LAUNCHER_SCRIPT = """#!/bin/sh
+# Быстрый запуск AppImage из распакованного дерева (Void Community AppImage Helper)
+image={image}
+tree={tree}
+if [ -x "$tree/AppRun" ] && ! [ "$image" -nt "$0" ]; then
+    touch "$tree" 2>/dev/null
+    export APPIMAGE="$image" APPDIR="$tree" ARGV0="$image"
+    exec "$tree/AppRun" "$@"
+fi
+exec "$image" "$@"
+"""
+
+def tree_size(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def running_trees(directory):
+    # Имена каталогов кэша, из которых сейчас запущены программы (по /proc/*/exe)
+    prefix = os.path.join(os.path.realpath(directory), '')
+    busy = set()
+    try:
+        pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return busy
+    for pid in pids:
+        try:
+            exe = os.readlink(f"/proc/{pid}/exe")
+        except OSError:
+            continue
+        if exe.startswith(prefix):
+            busy.add(exe[len(prefix):].split('/')[0])
+    return busy
+
+class LaunchCache:
+    # Каждый запуск AppImage монтирует SquashFS через FUSE и распаковывает её на лету.
+    # В режиме быстрого запуска образ один раз распаковывается (--appimage-extract)
+    # в каталог <sha256 образа>, а ярлык запускает скрипт apps/<имя>/run:
+    #   apps/<имя>/tree  — ссылка на распакованное дерево
+    #   apps/<имя>/image — ссылка на сам образ (для возврата ярлыка при выключении)
+    # Запуск отмечается touch дерева; деревья без ссылок удаляются, сверх бюджета —
+    # давно не запускавшиеся. Без дерева скрипт запускает сам образ.
+    def __init__(self, directory=LAUNCH_CACHE_DIR, max_bytes=LAUNCH_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.apps_dir = os.path.join(directory, 'apps')
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    def launcher_path(self, name):
+        return os.path.join(self.apps_dir, name, 'run')
+
+    def attached(self):
+        # {имя: путь образа} для приложений в режиме быстрого запуска
+        apps = {}
+        try:
+            names = os.listdir(self.apps_dir)
+        except OSError:
+            return apps
+        for name in names:
+            try:
+                apps[name] = os.readlink(os.path.join(self.apps_dir, name, 'image'))
+            except OSError:
+                pass
+        return apps
+
+    def prepare(self, appimage_path, name, sha256=''):
+        # Распаковывает образ, если его дерева ещё нет, и пишет скрипт запуска; возвращает путь скрипта
+        with get_tracer().span('launch.prepare', app=name) as span:
+            sha256 = sha256 or get_verification_records().verify(appimage_path)['sha256']
+            tree = os.path.join(self.directory, sha256)
+            staged = None
+            if not os.path.isfile(os.path.join(tree, 'AppRun')):
+                staged, size = self._extract(appimage_path)
+            try:
+                with self._lock:
+                    if staged and not os.path.isfile(os.path.join(tree, 'AppRun')):
+                        self._remove_tree(sha256)
+                        os.rename(os.path.join(staged, 'squashfs-root'), tree)
+                        self._store_size(sha256, size)
+                    self._write_launcher(name, appimage_path, tree)
+                    evicted = self._release(keep=sha256)
+            finally:
+                if staged:
+                    shutil.rmtree(staged, ignore_errors=True)
+            span.set(extracted=staged is not None, evicted=len(evicted))
+            return self.launcher_path(name)
+
+    def _extract(self, appimage_path):
+        # Распаковка runtime самого образа во временный каталог рядом с кэшем:
+        # прерванная распаковка не оставляет неполного дерева под настоящим именем
+        ensure_dir(self.directory)
+        staged = tempfile.mkdtemp(prefix='.extract-', dir=self.directory)
+        try:
+            subprocess.run([appimage_path, '--appimage-extract'], cwd=staged, capture_output=True,
+                           check=True, timeout=LAUNCH_EXTRACT_TIMEOUT)
+            root = os.path.join(staged, 'squashfs-root')
+            if not os.path.isfile(os.path.join(root, 'AppRun')):
+                raise ValueError(f"{appimage_path}: после распаковки нет AppRun")
+            size = tree_size(root)
+            if size > self.max_bytes:
+                raise ValueError(f"{appimage_path}: распакованный образ ({format_size(size)}) "
+                                 f"больше бюджета кэша запуска")
+            get_tracer().inc('launch_extracted_bytes_total', size)
+        except BaseException:
+            shutil.rmtree(staged, ignore_errors=True)
+            raise
+        return staged, size
+
+    def _size_path(self, name):
+        return os.path.join(self.directory, f"{name}.size")
+
+    def _store_size(self, name, size):
+        try:
+            with open(self._size_path(name), 'w') as f:
+                f.write(str(size))
+        except OSError as e:
+            log.warning(f"Не удалось записать размер дерева {name}: {e}")
+
+    def tree_bytes(self, name):
+        # Размер дерева запоминается при распаковке: обход всех файлов — только для
+        # деревьев из старых версий без записанного размера
+        try:
+            with open(self._size_path(name)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            size = tree_size(os.path.join(self.directory, name))
+            self._store_size(name, size)
+            return size
+
+    def _remove_tree(self, name):
+        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        try:
+            os.remove(self._size_path(name))
+        except OSError:
+            pass
+
+    def _write_launcher(self, name, appimage_path, tree):
+        app_dir = os.path.join(self.apps_dir, name)
+        ensure_dir(app_dir)
+        for link_name, target in (('tree', tree), ('image', appimage_path)):
+            link = os.path.join(app_dir, link_name)
+            tmp_link = f"{link}.tmp"
+            if os.path.lexists(tmp_link):
+                os.remove(tmp_link)
+            os.symlink(target, tmp_link)
+            os.replace(tmp_link, link)
+        run = self.launcher_path(name)
+        tmp_run = f"{run}.tmp"
+        with open(tmp_run, 'w') as f:
+            f.write(LAUNCHER_SCRIPT.format(image=shlex.quote(appimage_path),
+                                           tree=shlex.quote(os.path.join(app_dir, 'tree'))))
+        os.chmod(tmp_run, 0o755)
+        st = os.stat(appimage_path)
+        os.utime(tmp_run, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_run, run)
+
+    def refresh(self, appimage_path, name, sha256=''):
+        # После обновления образа: новое дерево вместо старого, если приложение в режиме быстрого запуска
+        if os.path.lexists(os.path.join(self.apps_dir, name)):
+            self.prepare(appimage_path, name, sha256)
+
+    def attach(self, entry):
+        # Установленное приложение → быстрый запуск: распаковка и Exec ярлыка на скрипт
+        name = Path(entry['desktop_file']).stem
+        launcher = self.prepare(entry['path'], name, entry['sha256'])
+        retarget_desktop_entries(entry['path'], launcher)
+
+    def detach(self, name):
+        # Ярлык снова запускает сам образ; дерево удаляется, если на него больше никто не ссылается
+        app_dir = os.path.join(self.apps_dir, name)
+        if not os.path.lexists(app_dir):
+            return
+        image = self.attached().get(name)
+        if image:
+            retarget_desktop_entries(self.launcher_path(name), image)
+        with self._lock:
+            shutil.rmtree(app_dir, ignore_errors=True)
+            self._release()
+
+    def detach_all(self):
+        for name in self.attached():
+            self.detach(name)
+
+    def _release(self, keep=None):
+        # Удаляет деревья без ссылок, затем сверх бюджета — по времени последнего запуска.
+        # Деревья запущенных сейчас программ и keep не трогаются. Вызывается под self._lock
+        referenced = set()
+        for name in os.listdir(self.apps_dir) if os.path.isdir(self.apps_dir) else ():
+            try:
+                referenced.add(os.path.basename(os.readlink(os.path.join(self.apps_dir, name, 'tree'))))
+            except OSError:
+                pass
+        busy = running_trees(self.directory) | {keep}
+        now = time.time()
+        trees, evicted = [], []
+        total = 0
+        if not os.path.isdir(self.directory):
+            return evicted
+        with os.scandir(self.directory) as it:
+            entries = list(it)
+        trees_present = {de.name for de in entries if de.is_dir(follow_symlinks=False)}
+        for de in entries:
+            if de.name.endswith('.size') and de.name[:-5] not in trees_present:
+                # Размер дерева, удалённого не через кэш
+                try:
+                    os.remove(de.path)
+                except OSError:
+                    pass
+                continue
+            if de.name == 'apps' or not de.is_dir(follow_symlinks=False):
+                continue
+            mtime = de.stat(follow_symlinks=False).st_mtime
+            if de.name.startswith('.'):
+                # Остатки распаковки, прерванной вместе с процессом
+                if now - mtime > LAUNCH_EXTRACT_TIMEOUT:
+                    shutil.rmtree(de.path, ignore_errors=True)
+                continue
+            if de.name in busy:
+                total += self.tree_bytes(de.name)
+            elif de.name not in referenced:
+                self._remove_tree(de.name)
+                evicted.append(de.name)
+            else:
+                size = self.tree_bytes(de.name)
+                total += size
+                trees.append((mtime, de.name, size))
+        for _, name, size in sorted(trees):
+            if total <= self.max_bytes:
+                break
+            total -= size
+            self._remove_tree(name)
+            evicted.append(name)
+        get_tracer().gauge('launch_cache_bytes', total)
+        if evicted:
+            get_tracer().inc('launch_evictions_total', len(evicted))
+        return evicted
+
+    def usage(self):
+        # (приложений, деревьев, байт) — для настроек и консольного помощника
+        trees = []
+        if os.path.isdir(self.directory):
+            with os.scandir(self.directory) as it:
+                trees = [de.name for de in it if de.name != 'apps' and not de.name.startswith('.')
+                         and de.is_dir(follow_symlinks=False)]
+        return len(self.attached()), len(trees), sum(self.tree_bytes(name) for name in trees)
+
+_launch_cache = None
+
+def get_launch_cache():
+    global _launch_cache
+    with _http_session_lock:
+        if _launch_cache is None:
+            _launch_cache = LaunchCache()
+        return _launch_cache
+
+# --- Установленные приложения ---
+class Inventory:
+    # Учёт установленных AppImage по пути: размер/mtime/inode, версия, хеш,
+    # источник и все созданные файлы (.desktop, иконки). Повторное сканирование
+    # папки инкрементальное — разбираются только новые и изменившиеся файлы.
+    def __init__(self, db_path=INVENTORY_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        ensure_dir(os.path.dirname(self.db_path))
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        conn.execute("""CREATE TABLE IF NOT EXISTS installed (
+            path TEXT PRIMARY KEY,
+            name TEXT,
+            version TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER,
+            sha256 TEXT,
+            source_url TEXT,
+            repo_url TEXT,
+            desktop_file TEXT,
+            icon_files TEXT,
+            installed_at REAL,
+            missing INTEGER DEFAULT 0)""")
+        return conn
+
+    @staticmethod
+    def _row_dict(row):
+        entry = dict(row)
+        entry['icon_files'] = json.loads(entry['icon_files'] or '[]')
+        return entry
+
+    def entries(self):
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT * FROM installed ORDER BY name COLLATE NOCASE").fetchall()
+            finally:
+                conn.close()
+        return [self._row_dict(row) for row in rows]
+
+    def get(self, path):
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT * FROM installed WHERE path = ?", (path,)).fetchone()
+            finally:
+                conn.close()
+        return self._row_dict(row) if row else None
+
+    def record_install(self, path, name, source_url='', repo_url='', desktop_file='', icon_files=(), version='', sha256=''):
+        st = os.stat(path)
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO installed VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)", (
+                        path, name, version, st.st_size, st.st_mtime_ns, st.st_ino, sha256,
+                        source_url, repo_url, desktop_file, json.dumps(list(icon_files)), time.time()))
+            finally:
+                conn.close()
+
+    def move(self, old_path, new_path):
+        # Файл заменён новой версией (дельта-обновление): перенос записи, обновление stat и хеша
+        entry = self.get(old_path)
+        if entry is None:
+            return
+        st = os.stat(new_path)
+        digests = get_verification_records().lookup(new_path) or {}
+        metadata, _ = inspect_appimage(new_path)
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM installed WHERE path = ?", (old_path,))
+                    conn.execute("INSERT OR REPLACE INTO installed VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)", (
+                        new_path, entry['name'], (metadata or {}).get('version', ''), st.st_size, st.st_mtime_ns,
+                        st.st_ino, digests.get('sha256', ''), entry['source_url'], entry['repo_url'],
+                        entry['desktop_file'], json.dumps(entry['icon_files']), time.time()))
+            finally:
+                conn.close()
+
+    def rescan(self, directory):
+        # Возвращает (новых/изменённых, пропавших). Неизменённые файлы (размер, mtime, inode)
+        # не открываются вовсе; у пропавших запись остаётся с пометкой missing,
+        # чтобы их ярлыки и иконки можно было удалить.
+        found = {}
+        try:
+            with os.scandir(directory) as it:
+                for de in it:
+                    if de.name.endswith('.AppImage') and de.is_file():
+                        st = de.stat()
+                        found[de.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        except OSError:
+            return 0, 0
+        prefix = os.path.join(directory, '')
+        with self._lock:
+            conn = self._connect()
+            try:
+                known = {row['path']: row for row in conn.execute(
+                    "SELECT path, size, mtime_ns, inode, name, missing FROM installed WHERE path LIKE ? || '%'",
+                    (prefix,))}
+            finally:
+                conn.close()
+
+        changed = [path for path, stat in found.items()
+                   if path not in known or known[path]['missing']
+                   or (known[path]['size'], known[path]['mtime_ns'], known[path]['inode']) != stat]
+        vanished = [path for path, row in known.items()
+                    if os.path.dirname(path) == os.path.normpath(directory) and path not in found and not row['missing']]
+
+        updates = []
+        records = get_verification_records()
+        for path in changed:
+            metadata, _ = inspect_appimage(path)
+            metadata = metadata or {}
+            digests = records.lookup(path) or {}
+            size, mtime_ns, inode = found[path]
+            name = metadata.get('name') or (known[path]['name'] if path in known else '') \
+                or os.path.basename(path)[:-len('.AppImage')]
+            updates.append((path, name, metadata.get('version', ''), size, mtime_ns, inode, digests.get('sha256', '')))
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for path, name, version, size, mtime_ns, inode, sha256 in updates:
+                        cur = conn.execute(
+                            "UPDATE installed SET name = ?, version = ?, size = ?, mtime_ns = ?, inode = ?, "
+                            "sha256 = ?, missing = 0 WHERE path = ?",
+                            (name, version, size, mtime_ns, inode, sha256, path))
+                        if not cur.rowcount:
+                            conn.execute(
+                                "INSERT INTO installed (path, name, version, size, mtime_ns, inode, sha256, "
+                                "source_url, repo_url, desktop_file, icon_files, installed_at, missing) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, '', '', '', '[]', ?, 0)",
+                                (path, name, version, size, mtime_ns, inode, sha256, time.time()))
+                    conn.executemany("UPDATE installed SET missing = 1 WHERE path = ?", [(p,) for p in vanished])
+            finally:
+                conn.close()
+        return len(changed), len(vanished)
+
+    def forget(self, path, keep_desktop=''):
+        # Убирает запись, не трогая AppImage (старая версия заменена новой с другим именем);
+        # иконки, на которые больше никто не ссылается, удаляются. Ярлык и скрипт быстрого
+        # запуска старой версии удаляются, если новая версия не переиспользовала ярлык (keep_desktop)
+        entry = self.get(path)
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM installed WHERE path = ?", (path,))
+            finally:
+                conn.close()
+        desktop_file = entry['desktop_file'] if entry else ''
+        if desktop_file and desktop_file != keep_desktop \
+                and all(other['desktop_file'] != desktop_file for other in self.entries()):
+            get_launch_cache().detach(Path(desktop_file).stem)
+            try:
+                os.remove(desktop_file)
+            except OSError:
+                pass
+            get_cache_refresher().schedule(desktop=True)
+        self.release_icons()
+
+    def release_icons(self):
+        referenced = {Path(icon).stem for entry in self.entries() for icon in entry['icon_files']}
+        if get_icon_store().evict_orphans(referenced):
+            get_cache_refresher().schedule(icons=True)
+
+    def installed_keys(self):
+        # Ключи для пометки «установлено» в результатах поиска: источники и имена
+        urls, repos, names = set(), set(), set()
+        for entry in self.entries():
+            if entry['missing']:
+                continue
+            if entry['source_url']:
+                urls.add(entry['source_url'])
+            if entry['repo_url']:
+                repos.add(entry['repo_url'].lower())
+            names.add(entry['name'].lower())
+        return urls, repos, names
+
+    def uninstall(self, path):
+        # Удаляет сам AppImage, его .desktop, иконки и запись инвентаря
+        entry = self.get(path)
+        if entry is None:
+            return []
+        removed = []
+        # Иконки из общего хранилища могут быть нужны другим приложениям — их убирает release_icons
+        legacy_icons = [icon for icon in entry['icon_files'] if not os.path.basename(icon).startswith(ICON_STORE_PREFIX)]
+        for artifact in [path, entry['desktop_file'], *legacy_icons]:
+            if artifact and os.path.lexists(artifact):
+                try:
+                    os.remove(artifact)
+                    removed.append(artifact)
+                except OSError as e:
+                    log.warning("Не удалось удалить %s: %s", artifact, e)
+                    get_tracer().error('inventory.uninstall', e)
+        for suffix in (".part", ".part.json"):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM installed WHERE path = ?", (path,))
+            finally:
+                conn.close()
+        self.release_icons()
+        if entry['desktop_file']:
+            get_launch_cache().detach(Path(entry['desktop_file']).stem)
+        get_cache_refresher().schedule(icons=bool(legacy_icons), desktop=bool(entry['desktop_file']))
+        return removed
+
+_inventory = None
+
+def get_inventory():
+    global _inventory
+    with _http_session_lock:
+        if _inventory is None:
+            _inventory = Inventory()
+        return _inventory
+
+def is_installed(item, installed_keys):
+    urls, repos, names = installed_keys
+    return (item.get('url') in urls or (item.get('repo_url') or '').lower() in repos
+            or item['name'].lower() in names)
+
+# --- Пакетная проверка обновлений ---
+GITHUB_DOWNLOAD_RE = re.compile(r'^https://github\.com/([^/]+)/([^/]+)/releases/download/')
+
+def github_repo_of(entry):
+    if entry.get('repo_url'):
+        return entry['repo_url'].rstrip('/')
+    match = GITHUB_DOWNLOAD_RE.match(entry.get('source_url') or '')
+    return f"https://github.com/{match.group(1)}/{match.group(2)}" if match else ''
+
+def check_entry_update(entry, session=None, max_wait=RATE_LIMIT_MAX_WAIT):
+    # Результат для одного установленного AppImage:
+    # status — 'outdated' | 'current' | 'unknown' | 'deferred' | 'error'
+    result = {'path': entry['path'], 'name': entry['name'], 'version': entry.get('version', ''),
+              'status': 'unknown', 'method': '', 'url': '', 'repo_url': '', 'detail': '',
+              'desktop_file': entry.get('desktop_file') or ''}
+    try:
+        update_info = read_update_info(entry['path'])
+    except (OSError, ValueError, struct.error):
+        update_info = ''
+    try:
+        if update_info:
+            zsync_url = resolve_update_info(update_info, session, max_wait)
+            if zsync_url:
+                header = fetch_zsync_header(zsync_url, session)
+                records = get_verification_records()
+                digests = records.lookup(entry['path']) or {}
+                if 'sha1' not in digests:
+                    digests = hash_file(entry['path'], ('sha1',))
+                    records.record(entry['path'], digests)
+                remote_sha1 = header.get('SHA-1', '').lower()
+                result['method'] = 'zsync'
+                result['detail'] = header.get('Filename', '')
+                result['status'] = 'outdated' if remote_sha1 and remote_sha1 != digests['sha1'] else 'current'
+                return result
+        repo_url = github_repo_of(entry)
+        if repo_url:
+            asset = get_github_appimage_asset(repo_url, session, max_wait)
+            if asset:
+                result.update(method='github', url=asset['url'], repo_url=repo_url,
+                              detail=asset['url'].rsplit('/', 1)[-1])
+                result['status'] = 'current' if asset['url'] == entry.get('source_url') else 'outdated'
+    except RateLimited as e:
+        result['status'] = 'deferred'
+        result['detail'] = str(e)
+    except (requests.RequestException, OSError, ValueError) as e:
+        result['status'] = 'error'
+        result['detail'] = str(e)
+    return result
+
+def check_updates(entries, session=None, max_workers=UPDATE_CHECK_WORKERS, on_result=None, is_cancelled=None):
+    # Проверяет все установленные AppImage в ограниченном пуле. Запросы к GitHub
+    # идут через общий GitHubRateLimiter и условные запросы кэша; когда лимит
+    # исчерпан надолго, задачи не падают, а помечаются 'deferred' с временем сброса.
+    session = session or get_http_session()
+    is_cancelled = is_cancelled or (lambda: False)
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for entry in entries:
+            if entry.get('missing'):
+                continue
+            futures[pool.submit(lambda e: None if is_cancelled() else check_entry_update(e, session), entry)] = entry
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            results.append(result)
+            if on_result:
+                on_result(result)
+    order = {'outdated': 0, 'deferred': 1, 'error': 2, 'unknown': 3, 'current': 4}
+    results.sort(key=lambda r: (order[r['status']], r['name'].lower()))
+    return results
+
+class SearchCancelled(Exception):
+    pass
+
+class BufferedResponse:
+    # Ответ, тело которого уже прочитано: то, что нужно HttpCache и лимитеру GitHub
+    def __init__(self, status_code, headers, content, encoding, elapsed=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.elapsed = elapsed
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+class SearchSession:
+    # Один поиск: номер поколения и отмена. Передаётся в search_all_sources
+    # вместо HTTP-сессии: тело ответа читается кусками с проверкой отмены,
+    # а cancel() закрывает соединения запросов, которые ещё идут.
+    _generations = itertools.count(1)
+
+    def __init__(self, query, session=None):
+        self.query = query
+        self.generation = next(self._generations)
+        self.http = session or get_http_session()
+        self._cancelled = threading.Event()
+        self._responses = set()
+        self._lock = threading.Lock()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            responses = list(self._responses)
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def get(self, url, **kwargs):
+        if self.is_cancelled():
+            raise SearchCancelled(url)
+        kwargs['stream'] = True
+        response = self.http.get(url, **kwargs)
+        with self._lock:
+            self._responses.add(response)
+        try:
+            chunks = []
+            for chunk in response.iter_content(16 * 1024):
+                if self.is_cancelled():
+                    raise SearchCancelled(url)
+                chunks.append(chunk)
+        except SearchCancelled:
+            raise
+        except Exception:
+            # Соединение закрыто из cancel() — это отмена, а не сетевая ошибка
+            if self.is_cancelled():
+                raise SearchCancelled(url)
+            raise
+        finally:
+            with self._lock:
+                self._responses.discard(response)
+            response.close()
+        return BufferedResponse(response.status_code, response.headers, b''.join(chunks), response.encoding,
+                                getattr(response, 'elapsed', None))
+
+def search_all_sources(query, session=None, include_hub=True, on_results=None):
+    with get_tracer().span('search', query=query) as span:
+        results, errors = _search_all_sources(query, session, include_hub, on_results)
+        cancelled = getattr(session, 'is_cancelled', lambda: False)()
+        span.set(results=len(results), errors=len(errors), cancelled=cancelled)
+        if cancelled:
+            span.status = 'cancelled'
+    return results, errors
+
+def _search_all_sources(query, session, include_hub, on_results):
+    # Все источники опрашиваются одновременно, релизы GitHub резолвятся
+    # в ограниченном пуле по мере прихода результатов поиска репозиториев.
+    # Итоговая задержка ≈ самый медленный запрос, а не их сумма.
+    # include_hub=False — AppImageHub уже отвечает из локального каталога.
+    # on_results(batch) вызывается из рабочего потока для каждой готовой порции.
+    # session может быть SearchSession: после её отмены новые запросы не ставятся,
+    # порции не отдаются, а функция возвращается, не дожидаясь оборванных запросов.
+    session = session or get_http_session()
+    is_cancelled = getattr(session, 'is_cancelled', lambda: False)
+    emit = on_results or (lambda batch: None)
+    results, errors = [], []
+    pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    try:
+        futures = {pool.submit(search_github_repos, query, session): ('repos', None)}
+        if include_hub:
+            futures[pool.submit(search_appimagehub, query, session)] = ('hub', None)
+        pending = set(futures)
+        while pending and not is_cancelled():
+            # Короткий таймаут — отмена замечается, даже если ни один запрос ещё не ответил
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if is_cancelled():
+                break
+            for future in done:
+                kind, repo = futures[future]
+                try:
+                    value = future.result()
+                except SearchCancelled:
+                    continue
+                except Exception as e:
+                    errors.append(f"{'AppImageHub' if kind == 'hub' else 'GitHub'}: {e}")
+                    get_tracer().error(f"search.{kind}", e)
+                    continue
+                if kind == 'hub':
+                    results.extend(value)
+                    emit(value)
+                elif kind == 'repos':
+                    for repo in value:
+                        asset_future = pool.submit(get_github_appimage_asset, repo.get('html_url', ''), session)
+                        futures[asset_future] = ('asset', repo)
+                        pending.add(asset_future)
+                elif value:
+                    result = {
+                        'name': repo.get('name', 'Без названия'),
+                        'description': repo.get('description', 'Нет описания') or 'Нет описания',
+                        'url': value['url'],
+                        'digests': value['digests'],
+                        'zsync_url': value['zsync_url'],
+                        'icon_url': '',
+                        'source': 'GitHub'
+                    }
+                    results.append(result)
+                    emit([result])
+    finally:
+        pool.shutdown(wait=not is_cancelled(), cancel_futures=True)
+    return results, errors
+
+# --- Настройки ---
+DEFAULT_SETTINGS = {
+    'appimage_dir': DEFAULT_APPIMAGE_DIR,
+    'opacity': 0.95,
+    'offline_mode': False,
+    'max_parallel_downloads': DEFAULT_MAX_PARALLEL_DOWNLOADS,
+    'bandwidth_limit_kib': 0,
+    'github_token': '',
+    'search_as_you_type': False,
+    'trace_enabled': False,
+    'launch_cache': False,
+    'launch_cache_limit_mb': LAUNCH_CACHE_MAX_MB
+}
+
+def load_settings():
+    # Настройки общие для окна и консольного помощника; применяются к кэшу и лимитеру GitHub
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            settings = {**DEFAULT_SETTINGS, **json.load(f)}
+    except (FileNotFoundError, json.JSONDecodeError):
+        settings = dict(DEFAULT_SETTINGS)
+    get_http_cache().offline = settings['offline_mode']
+    if settings['github_token']:
+        get_rate_limiter().token = settings['github_token']
+    if settings['trace_enabled']:
+        get_tracer().enable_trace_file()
+    get_launch_cache().enabled = settings['launch_cache']
+    get_launch_cache().max_bytes = settings['launch_cache_limit_mb'] * 1024 * 1024
+    return settings
+
+def save_settings(settings):
+    ensure_dir(CONFIG_DIR)
+    with open(CONFIG_FILE, 'w') as f:
+        json.dump(settings, f, indent=4)
+    # В настройках может лежать токен GitHub
+    os.chmod(CONFIG_FILE, 0o600)
+
+# --- Установка и обновление ---
+def create_desktop_entry(appimage_path, name, icon_url, desktop_name=''):
+    # Название, описание, категории и иконка берутся из самого образа,
+    # данные результата поиска и icon_url — запасной вариант.
+    # desktop_name — имя уже существующего ярлыка (при обновлении он перезаписывается)
+    # Возвращает созданные файлы и метаданные образа — для инвентаря
+    metadata, embedded_icon = inspect_appimage(appimage_path)
+    metadata = metadata or {}
+    artifacts = {'desktop_file': '', 'icon_files': [], 'metadata': metadata}
+    base_name = desktop_name or name.replace(' ', '_').lower()
+    desktop_filename = f"{base_name}.desktop"
+    desktop_path = os.path.join(DESKTOP_ENTRY_DIR, desktop_filename)
+
+    icon_path = "application-x-executable"
+    try:
+        if embedded_icon:
+            icon_path, artifacts['icon_files'] = get_icon_store().add_bytes(embedded_icon[0])
+        elif icon_url:
+            icon_path, artifacts['icon_files'] = get_icon_store().fetch(icon_url)
+    except Exception as e:
+        log.warning("Ошибка сохранения иконки: %s", e)
+        get_tracer().error('icon.store', e)
+
+    # В режиме быстрого запуска ярлык запускает скрипт кэша; без него — сам AppImage
+    program = appimage_path
+    if get_launch_cache().enabled:
+        try:
+            program = get_launch_cache().prepare(appimage_path, base_name)
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            log.warning("Быстрый запуск недоступен для %s: %s", name, e)
+            get_tracer().error('launch.prepare', e)
+
+    # Коды полей (%U, %F) из Exec образа сохраняются, программа заменяется на сам AppImage
+    exec_args = metadata.get('exec', '').partition(' ')[2]
+    exec_line = f"{program} {exec_args}".strip()
+    display_name = metadata.get('name') or name
+    comment = metadata.get('comment') or f"Запустить {name} через AppImage"
+    categories = metadata.get('categories') or "Utility;"
+    version_line = f"X-AppImage-Version={metadata['version']}\n" if metadata.get('version') else ""
+
+    desktop_content = f"""[Desktop Entry]
+Name={display_name}
+Exec={exec_line}
+Icon={icon_path}
+Type=Application
+Categories={categories}
+Comment={comment}
+Terminal=false
+{version_line}"""
+
+    try:
+        ensure_dir(os.path.dirname(desktop_path))
+        with open(desktop_path, 'w') as f:
+            f.write(desktop_content)
+        artifacts['desktop_file'] = desktop_path
+    except OSError as e:
+        log.warning("Не удалось создать .desktop файл: %s", e)
+        get_tracer().error('desktop.create', e)
+    get_cache_refresher().schedule(icons=bool(artifacts['icon_files']), desktop=bool(artifacts['desktop_file']))
+    return artifacts
+
+def plan_install(item, directory):
+    # Определяет ссылку (item['url']) и путь будущего файла; None — в релизе нет AppImage
+    url = resolve_download_url(item)
+    if not url:
+        return None
+    item['url'] = url
+    return os.path.join(directory, appimage_filename(item, url))
+
+def install_item(item, filepath, progress_callback=None, is_cancelled=None, throttle=None):
+    # Скачивание с проверкой, ярлык, иконки и запись в инвентарь.
+    # item['replaces'] — путь старой версии, которую заменяет эта установка
+    downloader = SegmentedDownloader(item['url'], filepath, progress_callback=progress_callback,
+                                     is_cancelled=is_cancelled, throttle=throttle,
+                                     expected_digests=expected_digests(item))
+    downloader.run()
+
+    os.chmod(filepath, 0o755)
+    get_verification_records().record(filepath, downloader.digests)
+    artifacts = create_desktop_entry(filepath, item['name'], item.get('icon_url', ''), item.get('desktop_name', ''))
+    get_inventory().record_install(
+        filepath, artifacts['metadata'].get('name') or item['name'],
+        source_url=item['url'], repo_url=item.get('repo_url', ''),
+        desktop_file=artifacts['desktop_file'], icon_files=artifacts['icon_files'],
+        version=artifacts['metadata'].get('version', ''), sha256=downloader.digests.get('sha256', ''))
+    old_path = item.get('replaces')
+    if old_path and old_path != filepath:
+        # Обновление с новым именем файла: старая версия больше не нужна
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+        get_inventory().forget(old_path, keep_desktop=artifacts['desktop_file'])
+    return artifacts
+
+def apply_delta_update(path, progress_callback=None, throttle=None, is_cancelled=None):
+    # zsync-обновление файла с переносом ярлыков и записи инвентаря на новый путь.
+    # Возвращает (new_path, updater); new_path = None — обновление не требуется
+    new_path, updater = update_appimage(path, progress_callback=progress_callback, throttle=throttle,
+                                        is_cancelled=is_cancelled)
+    if new_path is None:
+        return None, updater
+    if new_path != path:
+        retarget_desktop_entries(path, new_path)
+    get_inventory().move(path, new_path)
+    entry = get_inventory().get(new_path)
+    if entry and entry['desktop_file']:
+        # Распакованное дерево старой версии больше не годится
+        try:
+            get_launch_cache().refresh(new_path, Path(entry['desktop_file']).stem, entry['sha256'])
+        except (OSError, ValueError, subprocess.SubprocessError) as e:
+            log.warning("Быстрый запуск недоступен для %s: %s", entry['name'], e)
+            get_tracer().error('launch.prepare', e)
+    return new_path, updater
+
+def update_item(result):
+    # Результат check_updates с методом github → элемент для установки поверх старой версии
+    return {
+        'name': result['name'],
+        'description': '',
+        'url': result['url'],
+        'repo_url': result['repo_url'],
+        'icon_url': '',
+        'source': 'GitHub',
+        'replaces': result['path'],
+        # Ярлык старой версии назывался по результату поиска, а не по имени из образа
+        'desktop_name': Path(result['desktop_file']).stem if result.get('desktop_file') else '',
+    }
+
+def set_launch_mode(enabled, on_progress=None):
+    # Включение: все установленные приложения с ярлыками распаковываются и запускаются
+    # через кэш; выключение: ярлыки снова запускают образы, кэш очищается.
+    # Возвращает [(имя, ошибка)] приложений, которые перевести не удалось
+    cache = get_launch_cache()
+    cache.enabled = enabled
+    failed = []
+    if enabled:
+        entries = [entry for entry in get_inventory().entries() if entry['desktop_file'] and not entry['missing']]
+        for i, entry in enumerate(entries):
+            if on_progress:
+                on_progress(i, len(entries), entry['name'])
+            try:
+                cache.attach(entry)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                get_tracer().error('launch.prepare', e)
+                failed.append((entry['name'], str(e)))
+    else:
+        cache.detach_all()
+    get_cache_refresher().schedule(desktop=True)
+    return failed
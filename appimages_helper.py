@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Void Community AppImage Helper — консольный помощник
+# Без аргументов открывает окно, с командой работает без GTK и без дисплея:
+#   appimages-helper search krita
+#   appimages-helper install krita
+#   appimages-helper update --check
+#   appimages-helper list
+#   appimages-helper sync-manifest apps.json --prune
+#   appimages-helper launch-cache --enable
+#   appimages-helper --trace trace.jsonl --metrics metrics.prom install krita
+
+import time
+_started = time.perf_counter()
+
+import os
+import sys
+import json
+import argparse
+import threading
+
+from appimages_core import (
+    ProgressPublisher, RateLimited, TokenBucket, TransferStats, apply_delta_update, blend_results,
+    check_updates, format_eta, format_size, get_cache_refresher, get_catalog, get_http_cache,
+    get_inventory, get_launch_cache, get_tracer, install_item, is_installed, load_settings,
+    plan_install, save_settings, search_all_sources, set_launch_mode, update_item)
+
+# Допустимое время от начала работы скрипта до выполнения команды (импорты и настройки)
+STARTUP_BUDGET_MS = 150
+
+def print_progress(label):
+    # Прогресс одной строкой в stderr, не чаще PROGRESS_UPDATES_PER_SEC раз в секунду
+    stats = TransferStats()
+    interactive = sys.stderr.isatty()
+
+    def publish(keys):
+        stats.sample()
+        line = f"{label}: {format_size(stats.done)}"
+        if stats.total:
+            line += f" из {format_size(stats.total)}"
+        if stats.smoothed:
+            line += f", {format_size(stats.smoothed)}/с"
+        if (eta := stats.eta()) is not None:
+            line += f", осталось {format_eta(eta)}"
+        if interactive:
+            sys.stderr.write(f"\r\033[K{line}")
+            sys.stderr.flush()
+
+    def schedule(delay, fn):
+        timer = threading.Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+
+    publisher = ProgressPublisher(publish, schedule)
+
+    def on_progress(done, total):
+        stats.update(done, total)
+        publisher.touch(label)
+
+    def finish():
+        if interactive:
+            sys.stderr.write("\r\033[K")
+            sys.stderr.flush()
+
+    return on_progress, finish
+
+def find_item(query, offline=False):
+    # Точное совпадение имени, иначе лучший по match_score результат
+    local = get_catalog().search(query)
+    live = []
+    if not offline:
+        live, errors = search_all_sources(query, include_hub=not get_catalog().is_populated())
+        for error in errors:
+            print(f"Предупреждение: {error}", file=sys.stderr)
+    results = blend_results(query, local, live)
+    for item in results:
+        if item['name'].lower() == query.lower():
+            return item
+    return results[0] if results else None
+
+def manifest_spec(spec):
+    # Запись манифеста: "Имя", {"name": ..., "repo": "https://github.com/..."} или {"name": ..., "url": ...}
+    if isinstance(spec, str):
+        spec = {'name': spec}
+    return {
+        'name': spec.get('name') or os.path.basename(spec.get('url', '')).rsplit('.', 1)[0],
+        'url': spec.get('url', ''),
+        'repo': (spec.get('repo') or '').rstrip('/'),
+    }
+
+def manifest_item(spec, offline=False):
+    spec = manifest_spec(spec)
+    if spec['url']:
+        return {'name': spec['name'], 'description': '', 'url': spec['url'], 'icon_url': '', 'source': 'URL'}
+    if spec['repo']:
+        return {'name': spec['name'], 'description': '', 'repo_url': spec['repo'], 'icon_url': '',
+                'source': 'GitHub'}
+    return find_item(spec['name'], offline)
+
+def install(item, settings, throttle):
+    filepath = plan_install(item, settings['appimage_dir'])
+    if not filepath:
+        raise IOError(f"{item['name']}: в последнем релизе нет файла AppImage")
+    on_progress, finish = print_progress(item['name'])
+    try:
+        install_item(item, filepath, progress_callback=on_progress, throttle=throttle)
+    finally:
+        finish()
+    return filepath
+
+def cmd_search(args, settings):
+    live = []
+    if not args.offline:
+        live, errors = search_all_sources(args.query, include_hub=not get_catalog().is_populated())
+        for error in errors:
+            print(f"Предупреждение: {error}", file=sys.stderr)
+    results = blend_results(args.query, get_catalog().search(args.query), live)[:args.limit]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    keys = get_inventory().installed_keys()
+    for item in results:
+        badge = " [установлено]" if is_installed(item, keys) else ""
+        print(f"{item['name']} ({item['source']}){badge}")
+        if item.get('description'):
+            print(f"    {item['description'][:100]}")
+    if not results:
+        print("Ничего не найдено.")
+    return 0
+
+def cmd_install(args, settings, throttle):
+    failed = 0
+    for target in args.targets:
+        if target.startswith(('http://', 'https://')):
+            item = manifest_item({'url': target})
+        else:
+            item = find_item(target, args.offline)
+        if item is None:
+            print(f"{target}: не найдено", file=sys.stderr)
+            failed += 1
+            continue
+        try:
+            filepath = install(item, settings, throttle)
+        except Exception as e:
+            print(f"{item['name']}: ошибка установки: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"Установлено: {filepath}")
+    return 1 if failed else 0
+
+def cmd_update(args, settings, throttle):
+    inventory = get_inventory()
+    inventory.rescan(settings['appimage_dir'])
+    entries = inventory.entries()
+    if args.paths:
+        wanted = {os.path.abspath(path) for path in args.paths}
+        entries = [entry for entry in entries if entry['path'] in wanted]
+    failed = 0
+    for result in check_updates(entries):
+        title = result['name'] + (f" {result['version']}" if result['version'] else "")
+        if result['status'] != 'outdated':
+            detail = f" ({result['detail']})" if result['detail'] else ""
+            print(f"{title}: {result['status']}{detail}")
+            failed += result['status'] == 'error'
+            continue
+        if args.check:
+            print(f"{title}: есть обновление ({result['method']})")
+            continue
+        try:
+            if result['method'] == 'zsync':
+                on_progress, finish = print_progress(result['name'])
+                try:
+                    new_path, updater = apply_delta_update(result['path'], progress_callback=on_progress,
+                                                           throttle=throttle)
+                finally:
+                    finish()
+                if new_path and updater.tool:
+                    print(f"{title}: обновлено до {os.path.basename(new_path)} через {updater.tool}")
+                elif new_path:
+                    print(f"{title}: обновлено до {os.path.basename(new_path)}, скачано "
+                          f"{format_size(updater.downloaded_bytes)}, взято из старой версии "
+                          f"{format_size(updater.reused_bytes)}")
+            else:
+                filepath = install(update_item(result), settings, throttle)
+                print(f"{title}: обновлено до {os.path.basename(filepath)}")
+        except Exception as e:
+            print(f"{title}: ошибка обновления: {e}", file=sys.stderr)
+            failed += 1
+    return 1 if failed else 0
+
+def cmd_list(args, settings):
+    inventory = get_inventory()
+    inventory.rescan(settings['appimage_dir'])
+    entries = inventory.entries()
+    if args.json:
+        print(json.dumps(entries, ensure_ascii=False, indent=2))
+        return 0
+    for entry in entries:
+        version = f" {entry['version']}" if entry['version'] else ""
+        state = " [файл не найден]" if entry['missing'] else ""
+        print(f"{entry['name']}{version} — {entry['path']} ({format_size(entry['size'] or 0)}){state}")
+    return 0
+
+def cmd_sync_manifest(args, settings, throttle):
+    # Декларативная установка: всё из манифеста должно быть установлено,
+    # с --prune лишнее удаляется
+    try:
+        with open(args.manifest, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать манифест: {e}", file=sys.stderr)
+        return 1
+    if isinstance(manifest, list):
+        manifest = {'apps': manifest}
+    if manifest.get('directory'):
+        settings['appimage_dir'] = os.path.expanduser(manifest['directory'])
+
+    inventory = get_inventory()
+    inventory.rescan(settings['appimage_dir'])
+    keys = inventory.installed_keys()
+    wanted_names, wanted_urls, wanted_repos = set(), set(), set()
+    failed = unresolved = 0
+    for raw_spec in manifest.get('apps', []):
+        # Запись считается нужной ещё до поиска: не найденное (офлайн, лимит GitHub)
+        # не должно попасть под --prune
+        spec = manifest_spec(raw_spec)
+        wanted_names.add(spec['name'].lower())
+        wanted_urls.add(spec['url'] or None)
+        wanted_repos.add(spec['repo'].lower())
+        if not spec['url'] and not spec['repo'] and spec['name'].lower() in keys[2]:
+            print(f"{spec['name']}: уже установлено")
+            continue
+        item = manifest_item(spec, args.offline)
+        if item is None:
+            print(f"{spec['name']}: не найдено", file=sys.stderr)
+            failed += 1
+            unresolved += 1
+            continue
+        wanted_names.add(item['name'].lower())
+        wanted_urls.add(item.get('url'))
+        wanted_repos.add((item.get('repo_url') or '').lower())
+        if is_installed(item, keys):
+            print(f"{item['name']}: уже установлено")
+            continue
+        if args.dry_run:
+            print(f"{item['name']}: будет установлено")
+            continue
+        try:
+            filepath = install(item, settings, throttle)
+        except Exception as e:
+            print(f"{item['name']}: ошибка установки: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"Установлено: {filepath}")
+
+    if args.prune and unresolved:
+        print("Удаление лишнего пропущено: не все записи манифеста найдены", file=sys.stderr)
+    elif args.prune:
+        for entry in inventory.entries():
+            if (entry['name'].lower() in wanted_names or entry['source_url'] in wanted_urls - {'', None}
+                    or (entry['repo_url'] or '').lower() in wanted_repos - {''}):
+                continue
+            if args.dry_run:
+                print(f"{entry['name']}: будет удалено")
+                continue
+            inventory.uninstall(entry['path'])
+            print(f"Удалено: {entry['path']}")
+    return 1 if failed else 0
+
+def cmd_launch_cache(args, settings):
+    # Быстрый запуск из распакованных образов: включение, выключение, занятое место
+    if args.enable or args.disable:
+        settings['launch_cache'] = args.enable
+        save_settings(settings)
+        inventory = get_inventory()
+        inventory.rescan(settings['appimage_dir'])
+
+        def on_progress(done, total, name):
+            print(f"Распаковка {name} ({done + 1} из {total})...", file=sys.stderr)
+
+        failed = set_launch_mode(args.enable, on_progress=on_progress)
+        for name, error in failed:
+            print(f"{name}: {error}", file=sys.stderr)
+        if failed:
+            return 1
+    apps, trees, used = get_launch_cache().usage()
+    state = "включён" if settings['launch_cache'] else "выключен"
+    print(f"Быстрый запуск {state}: приложений {apps}, распаковано образов {trees}, "
+          f"{format_size(used)} из {format_size(get_launch_cache().max_bytes)}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="appimages-helper",
+        description="Поиск, установка и обновление AppImage. Без команды открывает окно.")
+    parser.add_argument('--offline', action='store_true', help="не обращаться к сети, только каталог и кэш")
+    parser.add_argument('--timing', action='store_true', help="показать время запуска")
+    parser.add_argument('--trace', metavar='FILE', help="писать операции (JSON Lines) в файл")
+    parser.add_argument('--metrics', metavar='FILE', help="сохранить метрики в формате Prometheus при выходе")
+    commands = parser.add_subparsers(dest='command')
+
+    search = commands.add_parser('search', help="поиск приложений")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=20)
+    search.add_argument('--json', action='store_true')
+
+    install = commands.add_parser('install', help="установить по имени или ссылке")
+    install.add_argument('targets', nargs='+', metavar='NAME_OR_URL')
+
+    update = commands.add_parser('update', help="обновить установленные приложения")
+    update.add_argument('paths', nargs='*', metavar='PATH')
+    update.add_argument('--check', action='store_true', help="только проверить")
+
+    listing = commands.add_parser('list', help="установленные приложения")
+    listing.add_argument('--json', action='store_true')
+
+    sync = commands.add_parser('sync-manifest', help="привести установленные приложения к манифесту")
+    sync.add_argument('manifest')
+    sync.add_argument('--prune', action='store_true', help="удалить приложения, которых нет в манифесте")
+    sync.add_argument('--dry-run', action='store_true', help="только показать, что будет сделано")
+
+    launch = commands.add_parser('launch-cache', help="быстрый запуск из распакованных образов")
+    mode = launch.add_mutually_exclusive_group()
+    mode.add_argument('--enable', action='store_true', help="распаковать установленные приложения")
+    mode.add_argument('--disable', action='store_true', help="вернуть запуск самих AppImage и очистить кэш")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        # GTK загружается только для окна
+        from appimages import main as run_gui
+        run_gui()
+        return 0
+
+    settings = load_settings()
+    if args.offline:
+        settings['offline_mode'] = True
+    get_http_cache().offline = settings['offline_mode']
+    throttle = TokenBucket(settings['bandwidth_limit_kib'] * 1024).consume
+    if args.trace:
+        get_tracer().enable_trace_file(os.path.expanduser(args.trace))
+
+    if args.timing:
+        startup_ms = (time.perf_counter() - _started) * 1000
+        verdict = "в пределах" if startup_ms <= STARTUP_BUDGET_MS else "превышает"
+        print(f"Запуск: {startup_ms:.0f} мс ({verdict} бюджета {STARTUP_BUDGET_MS} мс)", file=sys.stderr)
+
+    try:
+        if args.command == 'search':
+            return cmd_search(args, settings)
+        if args.command == 'install':
+            return cmd_install(args, settings, throttle)
+        if args.command == 'update':
+            return cmd_update(args, settings, throttle)
+        if args.command == 'list':
+            return cmd_list(args, settings)
+        if args.command == 'launch-cache':
+            return cmd_launch_cache(args, settings)
+        return cmd_sync_manifest(args, settings, throttle)
+    except RateLimited as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        # Кэши иконок и ярлыков обновляются один раз перед выходом
+        get_cache_refresher().flush()
+        if args.metrics:
+            get_tracer().write_prometheus(os.path.expanduser(args.metrics))
+
+if __name__ == "__main__":
+    sys.exit(main())
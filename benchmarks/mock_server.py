@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Локальная замена AppImageHub, GitHub API и файлового хостинга для бенчмарков.
+# Запуск: python3 mock_server.py --port 0 — первой строкой в stdout печатается адрес.
+#   /hub/api/applications/?search=q          — поиск AppImageHub
+#   /hub/feed.json                           — фид каталога
+#   /github/search/repositories?q=...        — поиск репозиториев GitHub
+#   /github/repos/<owner>/<repo>/releases/latest
+#   /files/<name>.AppImage                   — «AppImage» заданного размера, с Range
+# Задержка ответа, скорость отдачи файлов, поддержка Range и обрывы настраиваются флагами.
+
+import argparse
+import hashlib
+import json
+import random
+import socket
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BLOCK_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+class Payload:
+    # Содержимое файла — один псевдослучайный блок, повторённый до нужного размера:
+    # любой диапазон отдаётся без хранения файла целиком
+    def __init__(self, size, seed):
+        self.size = size
+        self.block = random.Random(seed).randbytes(BLOCK_SIZE)
+        hasher = hashlib.sha256()
+        for offset in range(0, size, BLOCK_SIZE):
+            hasher.update(self.block[:min(BLOCK_SIZE, size - offset)])
+        self.sha256 = hasher.hexdigest()
+
+    def read(self, offset, length):
+        start = offset % BLOCK_SIZE
+        data = self.block[start:start + length]
+        while len(data) < length:
+            data += self.block[:length - len(data)]
+        return data
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'appimages-mock/1.0'
+
+    def setup(self):
+        super().setup()
+        # Без Nagle: иначе маленькие JSON-ответы ждут отложенного ACK (~40 мс) и искажают замеры
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p]
+        if url.path.startswith('/hub/api/applications'):
+            return self.send_json(self.hub_search(query.get('search', [''])[0]))
+        if url.path == '/hub/feed.json':
+            return self.send_json(self.hub_feed())
+        if url.path == '/github/search/repositories':
+            return self.send_json(self.github_search(query.get('q', [''])[0]))
+        if len(parts) == 6 and parts[:2] == ['github', 'repos'] and parts[4:] == ['releases', 'latest']:
+            return self.send_json(self.github_release(parts[3]))
+        if len(parts) == 2 and parts[0] == 'files':
+            return self.send_file()
+        self.send_error(404)
+
+    # --- API ---
+    def app_names(self, query):
+        config = self.server.config
+        word = query.split('+')[0].split()[0] if query.split() else 'app'
+        return [f"{word}{i}" for i in range(config.apps)]
+
+    def hub_search(self, query):
+        base = self.server.base_url
+        return {'results': [{
+            'name': name,
+            'description': f"Тестовое приложение {name}",
+            'download_url': f"{base}/files/{name}.AppImage",
+            'icon_url': '',
+        } for name in self.app_names(query)]}
+
+    def hub_feed(self):
+        return {'items': [{
+            'name': f"app{i}",
+            'description': f"Тестовое приложение app{i}",
+            'categories': ['Utility'],
+            'links': [{'type': 'GitHub', 'url': f"bench/app{i}"},
+                      {'type': 'Download', 'url': f"https://github.com/bench/app{i}/releases"}],
+            'icons': [],
+        } for i in range(self.server.config.catalog_size)]}
+
+    def github_search(self, query):
+        return {'items': [{
+            'name': name,
+            'description': f"Репозиторий {name}",
+            'html_url': f"https://github.com/bench/{name}",
+        } for name in self.app_names(query)]}
+
+    def github_release(self, repo):
+        base = self.server.base_url
+        name = f"{repo}-x86_64.AppImage"
+        return {'tag_name': 'v1.0', 'assets': [{
+            'name': name,
+            'browser_download_url': f"{base}/files/{name}",
+            'digest': f"sha256:{self.server.payload.sha256}",
+        }]}
+
+    def send_json(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Remaining', '5000')
+        self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # --- Файлы ---
+    def send_file(self):
+        config = self.server.config
+        payload = self.server.payload
+        start, end = 0, payload.size - 1
+        range_header = self.headers.get('Range', '')
+        partial = config.ranges and range_header.startswith('bytes=')
+        if partial:
+            first, _, last = range_header[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last), payload.size - 1) if last else payload.size - 1
+            if start > end:
+                self.send_error(416)
+                return
+        length = end - start + 1
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('ETag', f'"{payload.sha256[:16]}"')
+        if partial:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{payload.size}")
+        self.end_headers()
+
+        # Обрыв: соединение закрывается на случайном месте ответа
+        fail_at = None
+        if length > 1 and random.random() < config.fail_rate:
+            fail_at = random.randrange(1, length)
+        sent = 0
+        started = time.monotonic()
+        try:
+            while sent < length:
+                n = min(CHUNK_SIZE, length - sent)
+                if fail_at is not None and sent + n > fail_at:
+                    self.wfile.write(payload.read(start + sent, fail_at - sent))
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    self.close_connection = True
+                    return
+                self.wfile.write(payload.read(start + sent, n))
+                sent += n
+                if config.bandwidth:
+                    ahead = sent / config.bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Заглушка AppImageHub/GitHub/файлового хостинга")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0, help="задержка перед каждым ответом")
+    parser.add_argument('--bandwidth-mbps', type=float, default=0,
+                        help="скорость отдачи файла на соединение, МБ/с (0 — без ограничения)")
+    parser.add_argument('--no-range', action='store_true', help="игнорировать заголовок Range")
+    parser.add_argument('--fail-rate', type=float, default=0, help="доля ответов с файлами, обрываемых на середине")
+    parser.add_argument('--file-size-mb', type=float, default=64)
+    parser.add_argument('--apps', type=int, default=5, help="результатов на поисковый запрос")
+    parser.add_argument('--catalog-size', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.latency = args.latency_ms / 1000
+    args.bandwidth = args.bandwidth_mbps * 1024 * 1024
+    args.ranges = not args.no_range
+    random.seed(args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    server.config = args
+    server.payload = Payload(int(args.file_size_mb * 1024 * 1024), args.seed)
+    server.base_url = f"http://{args.host}:{server.server_address[1]}"
+    print(server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Бенчмарки поиска, загрузки, главного цикла GTK и запуска против локальной заглушки
+# (mock_server.py). Результат — JSON для сравнения между версиями:
+#   python3 benchmarks/run.py --output bench.json
+#   python3 benchmarks/run.py --only download --bandwidth-mbps 20 --fail-rate 0.1
+
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SUITES = ('search', 'download', 'mainloop', 'startup')
+
+def summarize(samples):
+    # Миллисекунды: медиана, p95, разброс
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 2),
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        'max_ms': round(samples[-1], 2),
+    }
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def start_server(args):
+    command = [sys.executable, os.path.join(BENCH_DIR, 'mock_server.py'),
+               '--latency-ms', str(args.latency_ms), '--bandwidth-mbps', str(args.bandwidth_mbps),
+               '--fail-rate', str(args.fail_rate), '--file-size-mb', str(args.file_size_mb),
+               '--apps', str(args.apps), '--seed', str(args.seed)]
+    if args.no_range:
+        command.append('--no-range')
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    base_url = server.stdout.readline().strip()
+    if not base_url:
+        server.kill()
+        raise RuntimeError("заглушка не запустилась")
+    return server, base_url
+
+def point_core_at(core, base_url):
+    # Все внешние адреса ядра — на заглушку
+    core.APPIMAGEHUB_API = f"{base_url}/hub/api/applications/"
+    core.APPIMAGEHUB_FEED = f"{base_url}/hub/feed.json"
+    core.GITHUB_API = f"{base_url}/github"
+
+def bench_search(core, args):
+    cold, warm, first_batch = [], [], []
+    for i in range(args.repeats):
+        core.get_http_cache().clear()
+        for samples in (cold, warm):
+            started = time.perf_counter()
+            first = []
+
+            def on_results(batch):
+                if not first:
+                    first.append(time.perf_counter())
+
+            results, errors = core.search_all_sources(f"bench{i}", on_results=on_results)
+            samples.append((time.perf_counter() - started) * 1000)
+            if samples is cold and first:
+                first_batch.append((first[0] - started) * 1000)
+            if errors or not results:
+                raise RuntimeError(f"поиск не удался: {errors}")
+
+    catalog = core.get_catalog()
+    started = time.perf_counter()
+    catalog.sync()
+    sync_ms = (time.perf_counter() - started) * 1000
+    catalog_samples = []
+    for i in range(args.repeats * 10):
+        started = time.perf_counter()
+        catalog.search(f"app{i}")
+        catalog_samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'live_cold': summarize(cold),
+        'live_warm_cache': summarize(warm),
+        'first_batch': summarize(first_batch) if first_batch else None,
+        'catalog_sync_ms': round(sync_ms, 2),
+        'catalog_search': summarize(catalog_samples),
+    }
+
+def download_once(core, base_url, workdir, index, progress_callback=None):
+    asset = core.get_github_appimage_asset(f"https://github.com/bench/dl{index}")
+    path = os.path.join(workdir, f"dl{index}.AppImage")
+    downloader = core.SegmentedDownloader(asset['url'], path, progress_callback=progress_callback,
+                                          expected_digests=asset['digests'])
+    downloader.run()
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+def bench_download(core, base_url, args, workdir):
+    runs = []
+    for i in range(args.repeats):
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+        error = None
+        size = 0
+        try:
+            size = download_once(core, base_url, workdir, i)
+        except Exception as e:
+            error = str(e)
+        wall = time.perf_counter() - started
+        cpu = cpu_seconds() - cpu_before
+        megabytes = size / (1024 * 1024)
+        runs.append({
+            'seconds': round(wall, 3),
+            'mb_per_s': round(megabytes / wall, 2) if size else 0,
+            'cpu_ms_per_mb': round(cpu * 1000 / megabytes, 2) if size else None,
+            'error': error,
+        })
+    ok = [run for run in runs if not run['error']]
+    return {
+        'connections': core.DOWNLOAD_CONNECTIONS,
+        'file_size_mb': args.file_size_mb,
+        'succeeded': len(ok),
+        'failed': len(runs) - len(ok),
+        'mb_per_s_p50': statistics.median([run['mb_per_s'] for run in ok]) if ok else None,
+        'cpu_ms_per_mb_p50': statistics.median([run['cpu_ms_per_mb'] for run in ok]) if ok else None,
+        'runs': runs,
+    }
+
+def bench_mainloop(core, base_url, args, workdir):
+    # Запаздывание таймера главного цикла GLib, пока идёт загрузка с прогрессом
+    # через ProgressPublisher — так же, как в окне
+    try:
+        from gi.repository import GLib
+    except ImportError:
+        return {'skipped': "PyGObject недоступен"}
+
+    interval = 0.005
+    lateness = []
+    loop = GLib.MainLoop()
+    state = {'expected': time.perf_counter() + interval, 'done': False, 'error': None, 'published': 0}
+
+    def heartbeat():
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - state['expected']) * 1000)
+        state['expected'] = now + interval
+        if state['done']:
+            loop.quit()
+            return False
+        return True
+
+    stats = core.TransferStats()
+
+    def publish(keys):
+        stats.sample()
+        state['published'] += 1
+        core.format_size(stats.done)
+
+    publisher = core.ProgressPublisher(publish, lambda delay, fn: GLib.timeout_add(int(delay * 1000), fn))
+
+    def on_progress(done, total):
+        stats.update(done, total)
+        publisher.touch('bench')
+
+    def worker():
+        try:
+            download_once(core, base_url, workdir, 'mainloop', on_progress)
+        except Exception as e:
+            state['error'] = str(e)
+        state['done'] = True
+
+    GLib.timeout_add(int(interval * 1000), heartbeat)
+    threading.Thread(target=worker, daemon=True).start()
+    loop.run()
+    return {
+        'heartbeat_interval_ms': interval * 1000,
+        'lateness': summarize(lateness),
+        'stalls_over_50ms': sum(1 for value in lateness if value > 50),
+        'progress_publishes': state['published'],
+        'error': state['error'],
+    }
+
+def bench_startup(args, env):
+    # Полное время процесса (с интерпретатором) и собственная оценка помощника (--timing)
+    helper = os.path.join(REPO_DIR, 'appimages_helper.py')
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', REPO_DIR], env=env, capture_output=True)
+    commands = {
+        'helper_list': [sys.executable, helper, '--timing', 'list'],
+        'import_core': [sys.executable, '-c', 'import appimages_core'],
+    }
+    try:
+        import gi  # noqa: F401
+        commands['import_gui'] = [sys.executable, '-c', 'import appimages']
+    except ImportError:
+        pass
+    results = {}
+    for name, command in commands.items():
+        samples, reported = [], []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            completed = subprocess.run(command, env=env, cwd=REPO_DIR, capture_output=True, text=True)
+            samples.append((time.perf_counter() - started) * 1000)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{name}: {completed.stderr.strip()}")
+            match = re.search(r'Запуск: (\d+) мс', completed.stderr)
+            if match:
+                reported.append(float(match.group(1)))
+        results[name] = summarize(samples)
+        if reported:
+            results[name]['self_reported'] = summarize(reported)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Бенчмарки Void Community AppImage Helper")
+    parser.add_argument('--only', action='append', choices=SUITES, help="запустить только эти наборы")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0)
+    parser.add_argument('--no-range', action='store_true')
+    parser.add_argument('--fail-rate', type=float, default=0)
+    parser.add_argument('--file-size-mb', type=float, default=64)
+    parser.add_argument('--apps', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    suites = args.only or list(SUITES)
+
+    # Отдельный HOME: кэши, каталог и инвентарь бенчмарка не смешиваются с настоящими
+    home = tempfile.mkdtemp(prefix='appimages-bench-')
+    os.environ['HOME'] = home
+    os.environ.pop('GITHUB_TOKEN', None)
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    sys.path.insert(0, REPO_DIR)
+    import appimages_core as core
+
+    server, base_url = start_server(args)
+    point_core_at(core, base_url)
+    workdir = os.path.join(home, 'downloads')
+    os.makedirs(workdir)
+    results = {}
+    try:
+        for suite in suites:
+            try:
+                if suite == 'search':
+                    results[suite] = bench_search(core, args)
+                elif suite == 'download':
+                    results[suite] = bench_download(core, base_url, args, workdir)
+                elif suite == 'mainloop':
+                    results[suite] = bench_mainloop(core, base_url, args, workdir)
+                else:
+                    results[suite] = bench_startup(args, env)
+            except Exception as e:
+                results[suite] = {'error': str(e)}
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ('only', 'output')},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if any('error' in value for value in results.values() if isinstance(value, dict)) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -28,7 +28,7 @@ install_dependencies() {
 
   if command -v xbps-install >/dev/null 2>&1; then
     log "Обнаружен Void Linux"
-    local pkgs=("python3" "python3-requests" "python3-gobject" "gtk+3" "desktop-file-utils" "hicolor-icon-theme" "adwaita-icon-theme")
+    local pkgs=("python3" "python3-requests" "python3-gobject" "python3-zstandard" "python3-numpy" "zsync" "gtk+3" "desktop-file-utils" "hicolor-icon-theme" "adwaita-icon-theme")
     local missing=()
     for p in "${pkgs[@]}"; do
       if ! xbps-query -i "$p" >/dev/null 2>&1; then missing+=("$p"); fi
@@ -38,15 +38,15 @@ install_dependencies() {
   elif command -v apt >/dev/null 2>&1; then
     log "Обнаружен Debian/Ubuntu"
     apt update
-    apt install -y python3 python3-gi python3-requests gir1.2-gtk-3.0 desktop-file-utils hicolor-icon-theme adwaita-icon-theme
+    apt install -y python3 python3-gi python3-requests python3-zstandard python3-numpy zsync gir1.2-gtk-3.0 desktop-file-utils hicolor-icon-theme adwaita-icon-theme
 
   elif command -v dnf >/dev/null 2>&1; then
     log "Обнаружен Fedora"
-    dnf install -y python3 python3-gobject python3-requests gtk3 desktop-file-utils hicolor-icon-theme
+    dnf install -y python3 python3-gobject python3-requests python3-zstandard python3-numpy zsync gtk3 desktop-file-utils hicolor-icon-theme
 
   elif command -v pacman >/dev/null 2>&1; then
     log "Обнаружен Arch Linux"
-    pacman -Sy --noconfirm python python-gobject python-requests gtk3 desktop-file-utils hicolor-icon-theme
+    pacman -Sy --noconfirm python python-gobject python-requests python-zstandard python-numpy zsync gtk3 desktop-file-utils hicolor-icon-theme
 
   else
     warn "Не удалось определить пакетный менеджер. Убедитесь, что установлены: python3, gtk3, pygobject, requests"
@@ -59,8 +59,12 @@ main() {
 
   [[ ! -f "${APP_SRC_DIR}/appimages.py" ]] && error "appimages.py не найден! Запускайте из правильной папки."
 
-  log "Копирование appimages.py..."
-  install -m 0755 "${APP_SRC_DIR}/appimages.py" "${APP_DEST_DIR}/" || error "Ошибка копирования appimages.py"
+  log "Копирование appimages.py, appimages_core.py, appimages_helper.py..."
+  for f in appimages.py appimages_core.py appimages_helper.py; do
+    install -m 0755 "${APP_SRC_DIR}/$f" "${APP_DEST_DIR}/" || error "Ошибка копирования $f"
+  done
+  # Байткод заранее — быстрый холодный старт консольных команд
+  python3 -m compileall -q "$APP_DEST_DIR" || warn "Не удалось скомпилировать байткод"
 
   log "Копирование icons и applications..."
   cp -r "${APP_SRC_DIR}/icons" "$APP_DEST_DIR/" || error "Ошибка копирования icons"
@@ -69,7 +73,7 @@ main() {
   log "Создание лаунчера: $APP_LAUNCHER"
   cat > "$APP_LAUNCHER" << 'EOF'
 #!/bin/bash
-exec python3 /usr/local/bin/appimages/appimages.py "$@"
+exec python3 /usr/local/bin/appimages/appimages_helper.py "$@"
 EOF
   chmod +x "$APP_LAUNCHER" || error "Не удалось сделать лаунчер исполняемым"
 